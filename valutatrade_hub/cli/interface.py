@@ -1,12 +1,13 @@
 import shlex
-from valutatrade_hub.core import models, constants, utils, usecases, exceptions
+from valutatrade_hub.core import models, constants, utils, usecases, exceptions, valuation, alerts, orders
 import prompt
-import json
 import os
 import hashlib
 import datetime
 from valutatrade_hub.parser_service.updater import RatesUpdater
-from valutatrade_hub.parser_service.storage import RatesCache
+from valutatrade_hub.parser_service import history_query, scheduler
+from valutatrade_hub.parser_service.storage import ExchangeRatesRepo, RatesCache, get_history_repo
+from valutatrade_hub.infra import locking, repositories
 
 
 def main() -> None:
@@ -16,8 +17,24 @@ def main() -> None:
     Реализует интерактивную консольную оболочку для управления пользователями,
     портфелем, курсами валют и обновлением данных из внешних API.
     """
+    alert_book = alerts.subscribe()
+    order_book = orders.subscribe()
     while True:
-        user_input = prompt.string('> ').lower()
+        if constants.CURRENT_SESSION:
+            user = repositories.get_users_repo().get_by_username(constants.CURRENT_SESSION)
+            for alert in alert_book.take_triggered(user['user_id']) if user else []:
+                sign = '≥' if alert['direction'] == alerts.ABOVE else '≤'
+                print(f"Оповещение #{alert['id']}: {alert['pair']} = {alert['triggered_rate']:,.8f} "
+                      f"({sign} {alert['threshold']:,.8f}, {alert['triggered_at']})")
+            for order in order_book.take_closed(user['user_id']) if user else []:
+                if order['status'] == orders.FILLED:
+                    print(f"Ордер #{order['id']} исполнен: {order['side']} {order['amount']:.4f} "
+                          f"{order['currency']} по {order['fill_rate']:,.8f} USD")
+                else:
+                    print(f"Ордер #{order['id']} отклонён: {order['message']}")
+
+        raw_input = prompt.string('> ')
+        user_input = raw_input.lower()
         args = shlex.split(user_input)
         match args[0]:
             
@@ -31,35 +48,29 @@ def main() -> None:
                         username = args[args.index('--username') + 1]
                         password = args[args.index('--password') + 1]
 
-                        users = utils.safe_load_json(constants.USERS_PATH)
-
-                        user_already_exists = any(u['username'] == username for u in users)
-
-                        if user_already_exists:
-                            print(f'Имя пользователя {username} уже занято.')
-                        elif len(password) < 4:
-                            print('Пароль должен быть не короче 4 символов.')
-                        else:
-                            user_id = max((u['user_id'] for u in users), default=0) + 1
-                            salt = os.urandom(16).hex()
-                            hashed_password = hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
-                            registration_date = datetime.date.today().isoformat()
-
-                            new_user = models.User(user_id, username, hashed_password, salt, registration_date)
-                            users.append(new_user.new_user)
-                            with open(constants.USERS_PATH, 'w', encoding='utf-8') as f:
-                                json.dump(users, f, indent=4, ensure_ascii=False)
+                        # Проверка имени и выдача ID — под общей блокировкой регистрации
+                        with locking.named_lock('register'):
+                            users_repo = repositories.get_users_repo()
+                            user_already_exists = users_repo.get_by_username(username) is not None
 
-                            portfolios = utils.safe_load_json(constants.PORTFOLIOS_PATH)
+                            if user_already_exists:
+                                print(f'Имя пользователя {username} уже занято.')
+                            elif len(password) < 4:
+                                print('Пароль должен быть не короче 4 символов.')
+                            else:
+                                user_id = users_repo.next_user_id()
+                                salt = os.urandom(16).hex()
+                                hashed_password = hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
+                                registration_date = datetime.date.today().isoformat()
 
-                            new_portfolio = models.Portfolio(user_id, {'USD': {'balance': 10000.0}})
-                            portfolios.append(new_portfolio.new_portfolio)
+                                new_user = models.User(user_id, username, hashed_password, salt, registration_date)
+                                users_repo.add(new_user.new_user)
 
-                            with open(constants.PORTFOLIOS_PATH, 'w', encoding='utf-8') as f:
-                                json.dump(portfolios, f, indent=4, ensure_ascii=False)
+                                new_portfolio = models.Portfolio(user_id, models.Wallet('USD', 10000.0).wallet)
+                                repositories.get_portfolios_repo().save(new_portfolio.new_portfolio)
                             
-                            print(f'Пользователь {username} зарегистрирован (id = {user_id}). ' + 
-                                f'Войдите: login --username {username} --password ****')
+                                print(f'Пользователь {username} зарегистрирован (id = {user_id}). ' + 
+                                    f'Войдите: login --username {username} --password ****')
             
             case 'login':
                 if len(args) != 5:
@@ -71,14 +82,11 @@ def main() -> None:
                         username = args[args.index('--username') + 1]
                         password = args[args.index('--password') + 1]
 
-                        users = utils.safe_load_json(constants.USERS_PATH)
-                        user_found = False
-                        for user in users:
-                            if user['username'] == username:
-                                hashed_password = user['hashed_password']
-                                salt = user['salt']
-                                user_found = True
-                                break
+                        user = repositories.get_users_repo().get_by_username(username)
+                        user_found = user is not None
+                        if user_found:
+                            hashed_password = user['hashed_password']
+                            salt = user['salt']
                         
                         if not user_found:
                             print(f'Пользователь {username} не найден.')
@@ -103,11 +111,8 @@ def main() -> None:
                             base_ind = args.index('--base') + 1 if '--base' in args else None
                             base = args[base_ind].upper() if base_ind else constants.BASE_CURRENCY
 
-                            with open(constants.RATES_PATH, 'r', encoding='utf-8') as f:
-                                rates = json.load(f)
-                            
-                            pairs = rates['pairs']
-                            available_for_convert = base in [pair.split('_')[1] for pair in pairs.keys()]
+                            rates = RatesCache(constants.RATES_PATH).snapshot()
+                            available_for_convert = base in rates.cross
                             if not available_for_convert:
                                 print(f'Неизвестная базовая валюта: {base}.')
                             else:
@@ -115,12 +120,12 @@ def main() -> None:
                                 total, details = portfolio.get_total_value(rates, base)
                                 if total is None:
                                     print(f'Нет курса для пересчёта в {base}.')
-
-                                print(f'Портфель пользователя "{constants.CURRENT_SESSION}" (база: {base}):')
-                                for currency, info in details.items():
-                                    print(f'- {currency}: {info["original"]:,.2f} → {info["converted"]:,.2f} {base}')
-                                print('-' * 35)
-                                print(f'ИТОГО: {total:,.2f} {base}')
+                                else:
+                                    print(f'Портфель пользователя "{constants.CURRENT_SESSION}" (база: {base}):')
+                                    for currency, info in details.items():
+                                        print(f'- {currency}: {info["original"]:,.2f} → {info["converted"]:,.2f} {base}')
+                                    print('-' * 35)
+                                    print(f'ИТОГО: {total:,.2f} {base}')
      
             case 'buy':
                 if not constants.CURRENT_SESSION:
@@ -150,6 +155,33 @@ def main() -> None:
 
                 usecases.sell(currency, amount)
 
+            case 'trade-batch':
+                if not constants.CURRENT_SESSION:
+                    print('Сначала выполните login.')
+                    continue
+                if '--file' not in args or args.index('--file') + 1 >= len(args):
+                    print('Команда введена неправильно. Пример: trade-batch --file orders.csv')
+                    continue
+                # Пути — из исходного ввода: регистр в именах файлов важен
+                raw_args = shlex.split(raw_input)
+                path = raw_args[args.index('--file') + 1]
+                report_path = (raw_args[args.index('--report') + 1] if '--report' in args
+                               and args.index('--report') + 1 < len(args)
+                               else f'{os.path.splitext(path)[0]}.report.csv')
+                try:
+                    batch = usecases.load_orders(path)
+                    results = usecases.execute_batch(batch, constants.CURRENT_SESSION)
+                except (OSError, ValueError) as e:
+                    print(f'Не удалось выполнить пакет: {e}')
+                    continue
+
+                usecases.write_batch_report(report_path, results)
+                done = sum(1 for r in results if r['status'] == 'ok')
+                print(f'Ордеров: {len(results)}, исполнено: {done}, отклонено: {len(results) - done}. '
+                      f'Отчёт: {report_path}')
+                for r in [r for r in results if r['status'] != 'ok'][:5]:
+                    print(f"  строка {r['line']}: {r['message']}")
+
             case 'update-rates':
                 if len(args) != 1 and len(args) != 2:
                     print('Команда введена неправильно')
@@ -159,6 +191,8 @@ def main() -> None:
                     try:
                         summary = rates_updater.run_update(source=source)
                         print(f"Обновление завершено. Курсов обновлено: {summary['total_fetched']}")
+                        for client, timing in summary.get('timings', {}).items():
+                            print(f"  {client}: {timing['ms']} мс ({timing['status']})")
                         if summary['errors']:
                             print("Ошибки:")
                             for client, err in summary['errors']:
@@ -168,6 +202,121 @@ def main() -> None:
                     except Exception as e:
                         print(f"Критическая ошибка: {e}")
 
+            case 'scheduler-status':
+                status = scheduler.read_status()
+                if not status:
+                    print("Планировщик ещё не запускался. Запуск: poetry run scheduler")
+                    continue
+                print(f"Планировщик (статус на {status['updated_at']}):")
+                for name, info in status['sources'].items():
+                    tokens = f", бюджет: {info['tokens']}" if info.get('tokens') is not None else ''
+                    print(f"- {name}: каждые {info['interval']:.0f} с, "
+                          f"последний запуск: {info['last_run'] or '—'} ({info['last_status'] or '—'}), "
+                          f"следующий: {info['next_run']}{tokens}")
+                    if info.get('last_error'):
+                        print(f"    ошибка: {info['last_error']}")
+
+            case 'compact-history':
+                history = get_history_repo()
+                if not isinstance(history, ExchangeRatesRepo):
+                    print('Сжатие истории доступно только для JSON-хранилища.')
+                    continue
+                merged = history.compact()
+                segments = history.segments.segments()
+                print(f'Слито сегментов: {merged}. Сегментов истории: {len(segments)}, '
+                      f'размер: {sum(seg.size for seg in segments):,} байт')
+
+            case 'migrate-balances':
+                migrated = usecases.migrate_balances()
+                print(f'Портфелей переведено в целые минимальные единицы: {migrated}')
+
+            case 'report':
+                options = {}
+                i = 1
+                while i < len(args):
+                    if args[i].startswith('--') and i + 1 < len(args):
+                        options[args[i]] = args[i + 1]
+                        i += 2
+                    else:
+                        i += 1
+
+                base = options.get('--base', constants.BASE_CURRENCY).upper()
+                try:
+                    top_n = int(options.get('--top', 10))
+                except ValueError:
+                    print("Параметр --top должен быть числом.")
+                    continue
+
+                rates = RatesCache(constants.RATES_PATH).snapshot()
+                if base not in rates.cross:
+                    print(f'Неизвестная базовая валюта: {base}.')
+                    continue
+
+                report = valuation.value_portfolios(valuation.load_balances(), rates, base)
+                users_repo = repositories.get_users_repo()
+
+                print(f'Отчёт по портфелям (база: {base}, пользователей: {len(report.user_ids)}):')
+                print(f'Активы под управлением: {report.total_aum:,.2f} {base}')
+                for code, amount, value in sorted(
+                    zip(report.currencies, report.holdings, report.aum), key=lambda x: -x[2]
+                ):
+                    if code not in report.unpriced:
+                        print(f'- {code}: {amount:,.4f} → {value:,.2f} {base}')
+                if report.unpriced:
+                    print(f'Нет курса в {base} (не учтены): {", ".join(report.unpriced)}')
+
+                print(f'Топ-{top_n} по стоимости портфеля:')
+                for place, (user_id, total) in enumerate(report.leaderboard(top_n), start=1):
+                    user = users_repo.get_by_id(user_id)
+                    name = user['username'] if user else f'id={user_id}'
+                    print(f'{place}. {name}: {total:,.2f} {base}')
+
+            case 'rate-history':
+                if '--from' not in args or '--to' not in args:
+                    print('Команда введена неправильно.')
+                    continue
+
+                options = {}
+                i = 1
+                while i < len(args):
+                    if args[i].startswith('--') and i + 1 < len(args):
+                        options[args[i]] = args[i + 1]
+                        i += 2
+                    else:
+                        i += 1
+
+                source = options['--from'].upper()
+                to = options['--to'].upper()
+                bucket = options.get('--bucket')
+                try:
+                    since = history_query.parse_time(options['--since']) if '--since' in options else None
+                    until = history_query.parse_time(options['--until']) if '--until' in options else None
+                    query = history_query.HistoryQuery()
+                    if bucket:
+                        rows = query.bars(source, to, bucket, since, until)
+                    else:
+                        rows = query.points(source, to, since, until)
+                except ValueError as e:
+                    print(e)
+                    continue
+
+                if not rows:
+                    print(f'Нет истории курса {source} → {to} за указанный период.')
+                    continue
+
+                def fmt_ts(ts):
+                    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+                print(f'История {source} → {to}' + (f' (интервал {bucket}):' if bucket else ':'))
+                if bucket:
+                    for bar in rows:
+                        print(f"- {fmt_ts(bar['start'])}: O {bar['open']:,.8f} H {bar['high']:,.8f} "
+                              f"L {bar['low']:,.8f} C {bar['close']:,.8f} "
+                              f"(ср. {bar['mean']:,.8f}, точек: {bar['count']})")
+                else:
+                    for ts, rate in rows:
+                        print(f'- {fmt_ts(ts)}: {rate:,.8f}')
+
             case 'get-rate':
                 if len(args) != 5 or '--from' not in args or '--to' not in args:
                     print('Команда введена неправильно.')
@@ -236,12 +385,136 @@ def main() -> None:
                     sorted_items = sorted(filtered.items(), key=lambda x: x[0])
 
                 print(f"Курсы из кэша (обновлено: {last_refresh}):")
+                for source_name, refreshed_at in sorted(data.get('sources', {}).items()):
+                    print(f"  {source_name}: {refreshed_at}")
                 for key, info in sorted_items:
                     rate = info['rate']
                     updated = info['updated_at'].split('T')[1][:8]
                     source = info.get('source', 'unknown')
                     print(f"- {key}: {rate:,.8f} (↑ {updated}, {source})")
 
+            case 'alert':
+                if not constants.CURRENT_SESSION:
+                    print('Сначала выполните login.')
+                    continue
+                user_id = repositories.get_users_repo().get_by_username(constants.CURRENT_SESSION)['user_id']
+                action = args[1] if len(args) > 1 else None
+
+                if action == 'add':
+                    options = dict(zip(args[2::2], args[3::2]))
+                    directions = [d for d in (alerts.ABOVE, alerts.BELOW) if f'--{d}' in options]
+                    if '--currency' not in options or len(directions) != 1:
+                        print('Команда введена неправильно. Пример: alert add --currency BTC --above 70000')
+                        continue
+                    currency = options['--currency'].upper()
+                    base = options.get('--base', constants.BASE_CURRENCY).upper()
+                    try:
+                        threshold = float(options[f'--{directions[0]}'])
+                    except ValueError:
+                        print('Порог должен быть числом.')
+                        continue
+
+                    current = RatesCache(constants.RATES_PATH).snapshot().get(currency, base)
+                    if current is None:
+                        print(f'Курса {currency}_{base} нет в кэше. Выполните update-rates.')
+                        continue
+                    already = (current['rate'] >= threshold if directions[0] == alerts.ABOVE
+                               else current['rate'] <= threshold)
+                    if already:
+                        print(f"Условие уже выполнено: {currency}_{base} = {current['rate']:,.8f}.")
+                        continue
+                    try:
+                        alert = alert_book.add(user_id, currency, directions[0], threshold, base)
+                    except ValueError as e:
+                        print(e)
+                        continue
+                    print(f"Оповещение #{alert['id']} создано: {alert['pair']} {directions[0]} "
+                          f"{threshold:,.8f} (сейчас {current['rate']:,.8f}).")
+
+                elif action == 'list':
+                    user_alerts = alert_book.list(user_id)
+                    if not user_alerts:
+                        print('Оповещений нет.')
+                    for alert in user_alerts:
+                        state = (f"сработало {alert['triggered_at']} по {alert['triggered_rate']:,.8f}"
+                                 if alert['status'] == alerts.TRIGGERED else 'активно')
+                        print(f"#{alert['id']} {alert['pair']} {alert['direction']} "
+                              f"{alert['threshold']:,.8f} — {state}")
+
+                elif action == 'remove' and '--id' in args and args.index('--id') + 1 < len(args):
+                    try:
+                        alert_id = int(args[args.index('--id') + 1])
+                    except ValueError:
+                        print('Параметр --id должен быть числом.')
+                        continue
+                    if alert_book.remove(user_id, alert_id):
+                        print(f'Оповещение #{alert_id} удалено.')
+                    else:
+                        print(f'Оповещение #{alert_id} не найдено.')
+
+                else:
+                    print('Команда введена неправильно. Используйте: alert add | alert list | alert remove --id N')
+
+            case 'order':
+                if not constants.CURRENT_SESSION:
+                    print('Сначала выполните login.')
+                    continue
+                user_id = repositories.get_users_repo().get_by_username(constants.CURRENT_SESSION)['user_id']
+                action = args[1] if len(args) > 1 else None
+                options = dict(zip(args[2::2], args[3::2]))
+
+                if action == 'place':
+                    required = ('--side', '--type', '--currency', '--amount', '--price')
+                    if any(key not in options for key in required):
+                        print('Команда введена неправильно. Пример: '
+                              'order place --side buy --type limit --currency BTC --amount 0.1 --price 58000')
+                        continue
+                    try:
+                        amount = float(options['--amount'])
+                        price = float(options['--price'])
+                    except ValueError:
+                        print('Параметры --amount и --price должны быть числами.')
+                        continue
+                    currency = options['--currency'].upper()
+                    if currency not in RatesCache(constants.RATES_PATH).snapshot().cross:
+                        print(f'Нет курса {currency} → USD. Выполните update-rates.')
+                        continue
+                    try:
+                        order = order_book.place(user_id, constants.CURRENT_SESSION, options['--side'],
+                                                 options['--type'], currency, amount, price)
+                    except ValueError as e:
+                        print(e)
+                        continue
+                    print(f"Ордер #{order['id']} выставлен: {order['side']} {order['type']} "
+                          f"{order['amount']:.4f} {order['currency']} по {order['price']:,.8f} USD")
+
+                elif action == 'cancel' and '--id' in options:
+                    try:
+                        order_id = int(options['--id'])
+                    except ValueError:
+                        print('Параметр --id должен быть числом.')
+                        continue
+                    if order_book.cancel(user_id, order_id):
+                        print(f'Ордер #{order_id} отменён.')
+                    else:
+                        print(f'Открытый ордер #{order_id} не найден.')
+
+                elif action == 'list':
+                    user_orders = order_book.list(user_id, include_closed='--all' in args)
+                    if not user_orders:
+                        print('Ордеров нет.')
+                    for order in user_orders:
+                        state = order['status']
+                        if order['status'] == orders.FILLED:
+                            state += f" по {order['fill_rate']:,.8f}"
+                        elif order['status'] == orders.REJECTED:
+                            state += f": {order['message']}"
+                        print(f"#{order['id']} {order['side']} {order['type']} {order['amount']:.4f} "
+                              f"{order['currency']} по {order['price']:,.8f} USD — {state}")
+
+                else:
+                    print('Команда введена неправильно. Используйте: order place | order cancel --id N | order list [--all]')
+
             case 'exit':
                 break
             case _:
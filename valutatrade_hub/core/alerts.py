@@ -0,0 +1,267 @@
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from valutatrade_hub.core import constants, utils
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.parser_service.events import ALERT_TRIGGERED, RATE_CHANGE, EventBus, get_bus, read_events
+
+ABOVE = 'above'
+BELOW = 'below'
+
+ACTIVE = 'active'
+TRIGGERED = 'triggered'
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class ThresholdIndex:
+    """
+    Пороги активных оповещений одной пары и направления, отсортированные
+    по значению: пересечённые при движении курса находятся бинарным поиском.
+    """
+
+    def __init__(self, items: List[Tuple[float, int]]):
+        items = sorted(items)
+        self.thresholds = [threshold for threshold, _ in items]
+        self.ids = [alert_id for _, alert_id in items]
+
+    def insert(self, threshold: float, alert_id: int) -> None:
+        pos = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(pos, threshold)
+        self.ids.insert(pos, alert_id)
+
+    def discard(self, threshold: float, alert_id: int) -> None:
+        pos = bisect_left(self.thresholds, threshold)
+        while pos < len(self.ids) and self.thresholds[pos] == threshold:
+            if self.ids[pos] == alert_id:
+                del self.thresholds[pos], self.ids[pos]
+                return
+            pos += 1
+
+    def rising(self, old: float, new: float) -> List[int]:
+        """Пороги в (old, new] — курс поднялся до них или выше."""
+        return self.ids[bisect_right(self.thresholds, old):bisect_right(self.thresholds, new)]
+
+    def falling(self, old: float, new: float) -> List[int]:
+        """Пороги в [new, old) — курс опустился до них или ниже."""
+        return self.ids[bisect_left(self.thresholds, new):bisect_left(self.thresholds, old)]
+
+
+class AlertBook:
+    """
+    Оповещения пользователей о курсах (alerts.json).
+
+    Оповещение срабатывает один раз, когда курс пары CURRENCY_BASE
+    пересекает порог: above — снизу вверх, below — сверху вниз.
+    Проверяются только пороги между старым и новым курсом из события
+    rate_change, а не все оповещения.
+
+    alerts.json меняют только add и remove. Срабатывания дописываются
+    в журнал alerts.triggered.jsonl и в очередь уведомлений пользователя
+    alerts.pending/<user_id>.jsonl, которую take_triggered забирает целиком.
+    Индекс порогов обновляется точечно; полностью он перестраивается,
+    только если alerts.json изменил другой процесс.
+    """
+
+    def __init__(self, path: str = constants.ALERTS_PATH):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self.log_path = str(Path(path).with_suffix('.triggered.jsonl'))
+        self.pending_dir = Path(path).with_suffix('.pending')
+        self._lock = threading.Lock()
+        self._signature = None
+        self._log_offset = 0
+        self._alerts: Dict[int, Dict[str, Any]] = {}
+        self._index: Dict[Tuple[str, str], ThresholdIndex] = {}
+
+    def _stat_signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _index_add(self, alert: Dict[str, Any]) -> None:
+        key = (alert['pair'], alert['direction'])
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = ThresholdIndex([])
+        index.insert(float(alert['threshold']), alert['id'])
+
+    def _index_discard(self, alert: Dict[str, Any]) -> None:
+        index = self._index.get((alert['pair'], alert['direction']))
+        if index is not None:
+            index.discard(float(alert['threshold']), alert['id'])
+
+    def _apply_triggered(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            alert = self._alerts.get(record.get('id'))
+            if alert is None or alert['status'] != ACTIVE:
+                continue
+            alert.update(status=TRIGGERED, triggered_at=record['triggered_at'],
+                         triggered_rate=record['triggered_rate'])
+            self._index_discard(alert)
+
+    def _load(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Оповещения по id. alerts.json перечитывается, только если его изменил
+        другой процесс; из журнала срабатываний читается лишь новый хвост.
+        """
+        with self._lock:
+            signature = self._stat_signature()
+            if signature != self._signature:
+                alerts = [a for a in utils.safe_load_json(self.path) if isinstance(a, dict)]
+                self._alerts = {a['id']: a for a in alerts}
+                grouped: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+                for alert in alerts:
+                    if alert.get('status') == ACTIVE:
+                        grouped.setdefault((alert['pair'], alert['direction']), []).append(
+                            (float(alert['threshold']), alert['id'])
+                        )
+                self._index = {key: ThresholdIndex(items) for key, items in grouped.items()}
+                self._log_offset = 0
+                self._signature = signature
+            records, self._log_offset = read_events(self.log_path, self._log_offset)
+            self._apply_triggered(records)
+            return self._alerts
+
+    def _save(self) -> None:
+        """Переписывает alerts.json и запоминает его подпись, чтобы не перечитывать свою запись."""
+        utils.atomic_write_json(self.path, list(self._alerts.values()))
+        self._signature = self._stat_signature()
+
+    def add(self, user_id: int, currency: str, direction: str, threshold: float,
+            base: str = constants.BASE_CURRENCY) -> Dict[str, Any]:
+        """Создаёт оповещение и возвращает его запись."""
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f'Неизвестное направление: {direction}')
+        if threshold <= 0:
+            raise ValueError('Порог должен быть положительным числом')
+        with file_lock(self.lock_path):
+            alerts = self._load()
+            alert = {
+                'id': max(alerts, default=0) + 1,
+                'user_id': user_id,
+                'pair': f'{currency.upper()}_{base.upper()}',
+                'direction': direction,
+                'threshold': float(threshold),
+                'status': ACTIVE,
+                'created_at': _now_iso()
+            }
+            with self._lock:
+                alerts[alert['id']] = alert
+                self._index_add(alert)
+                self._save()
+        return dict(alert)
+
+    def remove(self, user_id: int, alert_id: int) -> bool:
+        """Удаляет оповещение пользователя; False, если такого нет."""
+        with file_lock(self.lock_path):
+            alerts = self._load()
+            alert = alerts.get(alert_id)
+            if alert is None or alert['user_id'] != user_id:
+                return False
+            with self._lock:
+                del alerts[alert_id]
+                if alert['status'] == ACTIVE:
+                    self._index_discard(alert)
+                self._save()
+        return True
+
+    def list(self, user_id: int) -> List[Dict[str, Any]]:
+        return [dict(a) for a in self._load().values() if a['user_id'] == user_id]
+
+    def crossed(self, pair: str, old: float, new: float) -> List[int]:
+        """id активных оповещений, пороги которых курс пересёк при переходе old → new."""
+        self._load()
+        if new > old:
+            index = self._index.get((pair, ABOVE))
+            return index.rising(old, new) if index else []
+        if new < old:
+            index = self._index.get((pair, BELOW))
+            return index.falling(old, new) if index else []
+        return []
+
+    def _pending_path(self, user_id: int) -> Path:
+        return self.pending_dir / f'{user_id}.jsonl'
+
+    def on_events(self, events: List[Dict[str, Any]], bus: Optional[EventBus] = None) -> List[Dict[str, Any]]:
+        """
+        Подписчик шины: дописывает сработавшие оповещения в журнал и очереди
+        уведомлений пользователей и публикует alert_triggered.
+        """
+        hits = {}
+        for event in events:
+            if event.get('type') != RATE_CHANGE or event.get('old') is None:
+                continue
+            for alert_id in self.crossed(event['pair'], event['old'], event['new']):
+                hits[alert_id] = event
+
+        if not hits:
+            return []
+
+        triggered = []
+        with file_lock(self.lock_path):
+            alerts = self._load()
+            for alert_id, event in hits.items():
+                alert = alerts.get(alert_id)
+                if alert is not None and alert['status'] == ACTIVE:
+                    triggered.append({**alert, 'status': TRIGGERED,
+                                      'triggered_at': event['ts'], 'triggered_rate': event['new']})
+            if triggered:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps({'id': a['id'], 'triggered_at': a['triggered_at'],
+                                                'triggered_rate': a['triggered_rate']}) + '\n'
+                                    for a in triggered))
+                by_user: Dict[int, List[Dict[str, Any]]] = {}
+                for alert in triggered:
+                    by_user.setdefault(alert['user_id'], []).append(alert)
+                self.pending_dir.mkdir(parents=True, exist_ok=True)
+                for user_id, user_alerts in by_user.items():
+                    with self._pending_path(user_id).open('a', encoding='utf-8') as f:
+                        f.write(''.join(json.dumps(a, ensure_ascii=False) + '\n' for a in user_alerts))
+                self._load()
+
+        (bus or get_bus()).publish([
+            {'type': ALERT_TRIGGERED, 'ts': alert['triggered_at'], **alert} for alert in triggered
+        ])
+        return triggered
+
+    def take_triggered(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        Сработавшие оповещения пользователя, о которых он ещё не уведомлён.
+
+        Очередь пользователя забирается и удаляется целиком; пока её нет,
+        проверка стоит один stat.
+        """
+        path = self._pending_path(user_id)
+        if not path.exists():
+            return []
+        with file_lock(self.lock_path):
+            fresh, _ = read_events(str(path))
+            path.unlink(missing_ok=True)
+        return fresh
+
+
+_book: Optional[AlertBook] = None
+
+
+def get_book() -> AlertBook:
+    global _book
+    if _book is None:
+        _book = AlertBook()
+    return _book
+
+
+def subscribe(bus: Optional[EventBus] = None) -> AlertBook:
+    """Подключает проверку оповещений к шине событий процесса."""
+    bus = bus or get_bus()
+    book = get_book()
+    bus.subscribe(book.on_events)
+    return book
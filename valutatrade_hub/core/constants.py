@@ -11,10 +11,28 @@ config = settings.SettingsLoader(
 USERS_PATH = config.get('USERS_PATH')
 RATES_PATH = config.get('RATES_PATH')
 PORTFOLIOS_PATH = config.get('PORTFOLIOS_PATH')
+PORTFOLIOS_DIR = config.get('PORTFOLIOS_DIR')
+PORTFOLIOS_LAYOUT = config.get('PORTFOLIOS_LAYOUT')
 BASE_CURRENCY = config.get('BASE_CURRENCY')
 EXCHANGE_RATES_PATH = config.get('EXCHANGE_RATES_PATH')
+EXCHANGE_RATES_LOG_PATH = config.get('EXCHANGE_RATES_LOG_PATH')
+EXCHANGE_RATES_COLUMNS_DIR = config.get('EXCHANGE_RATES_COLUMNS_DIR')
+EXCHANGE_RATES_SEGMENTS_DIR = config.get('EXCHANGE_RATES_SEGMENTS_DIR')
 RATES_TTL_SECONDS = config.get('RATES_TTL_SECONDS')
+RATES_HARD_TTL_SECONDS = config.get('RATES_HARD_TTL_SECONDS')
 ACTIONS_LOG_PATH = config.get('ACTIONS_LOG_PATH')
 LOGS_RAW_FORMAT = config.get('LOG_FORMAT')
+STORAGE_BACKEND = config.get('STORAGE_BACKEND')
+SQLITE_PATH = config.get('SQLITE_PATH')
+TRADE_JOURNAL = config.get('TRADE_JOURNAL')
+TRADE_JOURNAL_PATH = config.get('TRADE_JOURNAL_PATH')
+TRADE_CHECKPOINT_EVERY = config.get('TRADE_CHECKPOINT_EVERY')
+LOCKS_DIR = config.get('LOCKS_DIR')
+SCHEDULER_STATUS_PATH = config.get('SCHEDULER_STATUS_PATH')
+HTTP_CACHE_PATH = config.get('HTTP_CACHE_PATH')
+BREAKER_STATE_PATH = config.get('BREAKER_STATE_PATH')
+EVENTS_PATH = config.get('EVENTS_PATH')
+ALERTS_PATH = config.get('ALERTS_PATH')
+ORDERS_PATH = config.get('ORDERS_PATH')
 
 CURRENT_SESSION = None
\ No newline at end of file
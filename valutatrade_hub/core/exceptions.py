@@ -15,4 +15,10 @@ class InsufficientFundsError(Exception):
 class ApiRequestError(Exception):
     """Вызывается при ошибке обращения к внешнему API (сеть, статус, парсинг)."""
     def __init__(self, reason: str):
-        super().__init__(f'Ошибка при обращении к внешнему API: {reason}')
\ No newline at end of file
+        super().__init__(f'Ошибка при обращении к внешнему API: {reason}')
+
+
+class CircuitOpenError(ApiRequestError):
+    """Вызывается, пока провайдер отключён предохранителем после серии сбоев."""
+    def __init__(self, provider: str, retry_at: str):
+        super().__init__(f'{provider} is temporarily disabled after repeated failures (retry after {retry_at})')
\ No newline at end of file
@@ -1,6 +1,8 @@
 import hashlib
-from valutatrade_hub.core import constants, exceptions
-import json
+from typing import Optional
+from valutatrade_hub.core import exceptions, money
+from valutatrade_hub.infra import repositories
+from valutatrade_hub.parser_service.snapshot import RatesSnapshot
 from copy import deepcopy
 
 
@@ -76,45 +78,60 @@ class User:
 
 
 class Wallet:
-    """Кошелёк для хранения баланса в конкретной валюте."""
+    """
+    Кошелёк для хранения баланса в конкретной валюте.
 
-    def __init__(self, currency_code: str, balance: float = 0.0):
+    Баланс хранится целым числом минимальных единиц (money.scale),
+    float-значение balance — производное.
+    """
+
+    def __init__(self, currency_code: str, balance: float = 0.0, minor: Optional[int] = None):
         self._currency_code = currency_code
-        self._balance = balance
+        self._minor = money.to_minor(balance, currency_code) if minor is None else int(minor)
         self.wallet = {
             currency_code: {
                 'currency_code': self._currency_code,
-                'balance': self._balance
+                'balance': self.balance,
+                'minor': self._minor
             }
         }
     
     def deposit(self, amount: float) -> None:
         """Пополняет баланс."""
-        self._balance += amount
+        self._minor += money.to_minor(amount, self._currency_code)
     
     def get_balance_info(self) -> None:
         """Выводит текущий баланс."""
-        print(f'Текущий баланс: {self._balance}')
+        print(f'Текущий баланс: {self.balance}')
     
     @property
     def balance(self) -> float:
         """Геттер баланса."""
-        return self._balance
+        return money.to_amount(self._minor, self._currency_code)
     
     @balance.setter
     def balance(self, value: float) -> None:
         """Сеттер баланса."""
-        self._balance = value
+        self._minor = money.to_minor(value, self._currency_code)
+
+    @property
+    def minor(self) -> int:
+        """Баланс в минимальных единицах валюты."""
+        return self._minor
     
     def withdraw(self, amount: float) -> None:
         """Снимает средства, если достаточно."""
-        if amount <= self._balance:
-            self.balance -= amount
+        self.withdraw_minor(money.to_minor(amount, self._currency_code))
+
+    def withdraw_minor(self, minor: int) -> None:
+        """Снимает minor минимальных единиц, если достаточно."""
+        if minor <= self._minor:
+            self._minor -= minor
         else:
             raise exceptions.InsufficientFundsError(
                 self.balance,
                 self._currency_code,
-                amount
+                money.to_amount(minor, self._currency_code)
             )
 
 
@@ -138,31 +155,38 @@ class Portfolio:
                 currency_code: new_wallet.wallet[currency_code]
             })
     
-    def get_total_value(self, rates: dict, base: str) -> tuple[float | None, dict | None]:
-        """Возвращает общую стоимость и детали в базовой валюте."""
-        pairs = rates["pairs"]
+    def get_total_value(self, rates: RatesSnapshot | dict, base: str) -> tuple[float | None, dict | None]:
+        """
+        Возвращает общую стоимость и детали в базовой валюте.
+
+        Пересчёт идёт по кросс-курсам снимка, поэтому база может быть
+        любой валютой, достижимой по закэшированным парам.
+        """
+        if not isinstance(rates, RatesSnapshot):
+            rates = RatesSnapshot(rates["pairs"], rates.get("last_refresh"))
+        cross = rates.cross
         total = 0
         details = {}
 
+        # Сумма копится в целых минимальных единицах базовой валюты — без накопления ошибки
         for currency, data in self._wallets.items():
-            balance = data["balance"]
+            minor = money.wallet_minor(data, currency)
 
             if currency == base:
-                converted = balance
+                converted = minor
             else:
-                pair_name = f"{currency}_{base}"
-                if pair_name not in pairs:
+                rate = cross.rate(currency, base)
+                if rate is None:
                     return None, None
-                rate = pairs[pair_name]["rate"]
-                converted = balance * rate
+                converted = money.convert(minor, currency, rate, base)
 
             total += converted
             details[currency] = {
-                "original": balance,
-                "converted": converted
+                "original": money.to_amount(minor, currency),
+                "converted": money.to_amount(converted, base)
             }
 
-        return total, details
+        return money.to_amount(total, base), details
 
     def get_wallet(self, currency_code: str) -> dict:
         """Возвращает данные кошелька по коду валюты."""
@@ -171,18 +195,16 @@ class Portfolio:
     @property
     def user(self) -> User:
         """Загружает и возвращает объект User по user_id."""
-        with open(constants.USERS_PATH, 'r', encoding='utf-8') as f:
-            users = json.load(f)
-            for user in users:
-                if self._user_id == user['user_id']:
-                    return User(
-                        self._user_id,
-                        user['username'],
-                        user['hashed_password'],
-                        user['salt'],
-                        user['registration_date']
-                    )
-        raise ValueError(f"User with id {self._user_id} not found")
+        user = repositories.get_users_repo().get_by_id(self._user_id)
+        if user is None:
+            raise ValueError(f"User with id {self._user_id} not found")
+        return User(
+            self._user_id,
+            user['username'],
+            user['hashed_password'],
+            user['salt'],
+            user['registration_date']
+        )
 
     @property
     def wallets(self) -> dict:
@@ -0,0 +1,126 @@
+from decimal import Decimal, ROUND_HALF_EVEN, InvalidOperation
+from functools import lru_cache
+from typing import NamedTuple, Tuple, Union
+
+# Знаков после запятой (размер минимальной единицы) по валютам
+SCALES = {
+    'USD': 2, 'EUR': 2, 'GBP': 2, 'RUB': 2, 'JPY': 0,
+    'BTC': 8, 'ETH': 8, 'SOL': 8,
+}
+DEFAULT_SCALE = 8
+
+DOWN = 'down'        # в пользу системы при выплате (выручка от продажи)
+UP = 'up'            # в пользу системы при списании (стоимость покупки)
+HALF_EVEN = 'half_even'
+
+
+def scale(code: str) -> int:
+    return SCALES.get(code.upper(), DEFAULT_SCALE)
+
+
+@lru_cache(maxsize=64)
+def _pow10(n: int) -> int:
+    return 10 ** n
+
+
+def to_minor(amount: Union[float, int, str], code: str) -> int:
+    """
+    Сумма → целое число минимальных единиц валюты (банковское округление).
+
+    float переводится через repr, поэтому 0.1 даёт ровно 10 центов,
+    а не двоичное приближение.
+    """
+    try:
+        value = Decimal(repr(amount) if isinstance(amount, float) else str(amount))
+        return int(value.scaleb(scale(code)).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'Некорректная сумма: {amount!r}')
+
+
+def to_amount(minor: int, code: str) -> float:
+    """Целые минимальные единицы → float для отображения и JSON."""
+    return minor / _pow10(scale(code))
+
+
+@lru_cache(maxsize=1024)
+def rate_ratio(rate: float) -> Tuple[int, int]:
+    """
+    Курс как несократимая дробь (числитель, знаменатель), точно равная его
+    десятичной записи: 1.2345678901234e-7 → 12345678901234 / 10**20.
+    Точность не зависит от величины курса.
+    """
+    return Decimal(repr(float(rate))).as_integer_ratio()
+
+
+def _divide(num: int, den: int, rounding: str) -> int:
+    q, r = divmod(num, den)
+    if not r or rounding == DOWN:
+        return q
+    if rounding == UP:
+        return q + 1
+    twice = 2 * r
+    return q + 1 if twice > den or (twice == den and q % 2) else q
+
+
+def convert(minor: int, from_code: str, rate: float, to_code: str, rounding: str = HALF_EVEN) -> int:
+    """
+    Пересчёт minor единиц from_code в минимальные единицы to_code по курсу rate
+    (сколько to_code за одну единицу from_code). Только целочисленная арифметика
+    над точной дробью курса; округление — одно, в конце.
+    """
+    num, den = rate_ratio(rate)
+    return _divide(minor * num * _pow10(scale(to_code)), den * _pow10(scale(from_code)), rounding)
+
+
+class Money(NamedTuple):
+    """Сумма в целых минимальных единицах валюты."""
+    minor: int
+    currency: str
+
+    @classmethod
+    def of(cls, amount: Union[float, int, str], currency: str) -> 'Money':
+        return cls(to_minor(amount, currency), currency.upper())
+
+    @property
+    def amount(self) -> float:
+        return to_amount(self.minor, self.currency)
+
+    def _same(self, other: 'Money') -> None:
+        if other.currency != self.currency:
+            raise ValueError(f'Разные валюты: {self.currency} и {other.currency}')
+
+    def __add__(self, other: 'Money') -> 'Money':
+        self._same(other)
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other: 'Money') -> 'Money':
+        self._same(other)
+        return Money(self.minor - other.minor, self.currency)
+
+    def convert(self, rate: float, to_code: str, rounding: str = HALF_EVEN) -> 'Money':
+        return Money(convert(self.minor, self.currency, rate, to_code, rounding), to_code.upper())
+
+    def __str__(self) -> str:
+        return f'{self.amount:,.{scale(self.currency)}f} {self.currency}'
+
+
+def wallet_minor(wallet: dict, code: str) -> int:
+    """Баланс кошелька в минимальных единицах; старые записи без minor переводятся из balance."""
+    minor = wallet.get('minor')
+    return int(minor) if minor is not None else to_minor(float(wallet.get('balance') or 0), code)
+
+
+def set_wallet_minor(wallet: dict, code: str, minor: int) -> None:
+    """Записывает баланс: minor — источник истины, balance — производное значение."""
+    wallet['minor'] = int(minor)
+    wallet['balance'] = to_amount(minor, code)
+
+
+def migrate_wallets(wallets: dict) -> bool:
+    """Добавляет minor кошелькам без него. Возвращает True, если что-то изменилось."""
+    changed = False
+    for code, wallet in wallets.items():
+        if wallet.get('minor') is None:
+            set_wallet_minor(wallet, code, wallet_minor(wallet, code))
+            changed = True
+    return changed
@@ -0,0 +1,381 @@
+import heapq
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from valutatrade_hub import decorators
+from valutatrade_hub.core import constants, models, money, usecases, utils
+from valutatrade_hub.infra import locking, repositories
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.parser_service.events import RATE_CHANGE, EventBus, get_bus, read_events
+from valutatrade_hub.parser_service.snapshot import get_rates_snapshot
+
+BUY = 'buy'
+SELL = 'sell'
+LIMIT = 'limit'
+STOP = 'stop'
+
+OPEN = 'open'
+FILLED = 'filled'
+REJECTED = 'rejected'
+CANCELLED = 'cancelled'
+
+ORDER_FILLED = 'order_filled'
+
+# Куча «цена поднялась до порога» (min-heap) и «опустилась до порога» (max-heap)
+RISE = 'rise'
+FALL = 'fall'
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def trigger_direction(side: str, kind: str) -> str:
+    """
+    Когда срабатывает ордер: RISE — курс ≥ цены, FALL — курс ≤ цены.
+
+    Лимитная покупка и стоп-продажа ждут падения, лимитная продажа
+    и стоп-покупка — роста.
+    """
+    return FALL if (side == BUY) == (kind == LIMIT) else RISE
+
+
+_fill_buy = decorators.log_action('ORDER_BUY')(usecases.execute_trade)
+_fill_sell = decorators.log_action('ORDER_SELL')(usecases.execute_trade)
+
+
+class OrderBook:
+    """
+    Отложенные лимитные и стоп-ордера с индексом по цене.
+
+    В orders.json лежат только открытые ордера; закрытые (исполненные,
+    отклонённые, отменённые) дописываются в журнал orders.closed.jsonl,
+    а исполненные и отклонённые — ещё и в очередь уведомлений пользователя
+    orders.pending/<user_id>.jsonl. Журнал главнее orders.json: ордер,
+    который есть в журнале, считается закрытым.
+
+    Открытые ордера каждой пары лежат в двух кучах по цене срабатывания:
+    на новом курсе из события rate_change снимаются только вершины,
+    условие которых выполнено, поэтому стоимость проверки растёт с числом
+    исполнений, а не открытых ордеров. Отменённые ордера удаляются из куч
+    лениво. Исполнение — usecases.execute_trade по курсу события;
+    если сделка невозможна, ордер отклоняется.
+
+    Исполнение идёт по журналу намерений: запись FILLED с балансами
+    затронутых кошельков до и после сделки попадает в журнал (с fsync)
+    до сохранения портфеля. Если процесс упал между ними, _recover
+    по балансам понимает, сохранилась ли сделка, и при необходимости
+    доисполняет её — повторно ордер не исполняется.
+    """
+
+    def __init__(self, path: str = constants.ORDERS_PATH):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self.closed_path = str(Path(path).with_suffix('.closed.jsonl'))
+        self.pending_dir = Path(path).with_suffix('.pending')
+        self._lock = threading.RLock()
+        self._signature = None
+        self._log_offset = 0
+        self._next_id = 1
+        self._closed_ids = set()
+        self._orders: Dict[int, Dict[str, Any]] = {}
+        self._heaps: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+        # Исполнения из журнала, ордера которых ещё числятся открытыми в orders.json
+        self._dangling: Dict[int, Dict[str, Any]] = {}
+        # Закрытые ордера из orders.json прежнего формата — переносятся в журнал
+        self._legacy: List[Dict[str, Any]] = []
+
+    def _stat_signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _push(self, order: Dict[str, Any]) -> None:
+        direction = trigger_direction(order['side'], order['type'])
+        key = -order['price'] if direction == FALL else order['price']
+        heapq.heappush(self._heaps.setdefault((order['pair'], direction), []), (key, order['id']))
+
+    def _load(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Открытые ордера по id. orders.json перечитывается (и кучи перестраиваются),
+        только если его изменил другой процесс; из журнала закрытых читается новый хвост.
+        """
+        with self._lock:
+            signature = self._stat_signature()
+            if signature != self._signature:
+                orders = [o for o in utils.safe_load_json(self.path) if isinstance(o, dict)]
+                self._orders = {o['id']: o for o in orders
+                                if o['status'] == OPEN and o['id'] not in self._closed_ids}
+                self._legacy = [o for o in orders
+                                if o['status'] != OPEN and o['id'] not in self._closed_ids]
+                grouped: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+                for order in self._orders.values():
+                    direction = trigger_direction(order['side'], order['type'])
+                    key = -order['price'] if direction == FALL else order['price']
+                    grouped.setdefault((order['pair'], direction), []).append((key, order['id']))
+                for heap in grouped.values():
+                    heapq.heapify(heap)
+                self._heaps = grouped
+                self._next_id = max(self._next_id, max((o['id'] for o in orders), default=0) + 1)
+                self._signature = signature
+            records, self._log_offset = read_events(self.closed_path, self._log_offset)
+            for record in records:
+                self._closed_ids.add(record['id'])
+                self._next_id = max(self._next_id, record['id'] + 1)
+                if self._orders.pop(record['id'], None) is not None and 'fill' in record:
+                    self._dangling[record['id']] = record
+            return self._orders
+
+    def _save(self) -> None:
+        # Недоисполненные остаются в файле, чтобы их нашёл _recover любого процесса
+        dangling = [{**_public(record), 'status': OPEN} for record in self._dangling.values()]
+        utils.atomic_write_json(self.path, list(self._orders.values()) + dangling, durable=True)
+        # Свою запись кучи уже отражают — перестраивать их незачем
+        self._signature = self._stat_signature()
+
+    def _append_closed(self, records: List[Dict[str, Any]]) -> None:
+        """Дописывает закрытые ордера в журнал (с fsync) и в очереди уведомлений."""
+        with open(self.closed_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        by_user: Dict[int, List[Dict[str, Any]]] = {}
+        for record in records:
+            if record['status'] in (FILLED, REJECTED) and not record.get('notified'):
+                by_user.setdefault(record['user_id'], []).append(_public(record))
+        if by_user:
+            self.pending_dir.mkdir(parents=True, exist_ok=True)
+        for user_id, user_records in by_user.items():
+            with self._pending_path(user_id).open('a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in user_records))
+
+    def _pending_path(self, user_id: int) -> Path:
+        return self.pending_dir / f'{user_id}.jsonl'
+
+    def _recover(self) -> None:
+        """
+        Переносит в журнал закрытые ордера прежнего формата и доводит до конца
+        исполнения, прерванные между записью в журнал и сохранением портфеля.
+        Вызывается под файловой блокировкой книги.
+        """
+        if not (self._dangling or self._legacy):
+            return
+        if self._legacy:
+            self._append_closed(self._legacy)
+            self._legacy = []
+            self._load()
+        for order_id, record in list(self._dangling.items()):
+            _redo_fill(record)
+            del self._dangling[order_id]
+        self._save()
+
+    def place(self, user_id: int, username: str, side: str, kind: str,
+              currency: str, amount: float, price: float) -> Dict[str, Any]:
+        """Выставляет ордер; если условие уже выполнено — сразу исполняет его."""
+        if side not in (BUY, SELL) or kind not in (LIMIT, STOP):
+            raise ValueError('Ордер: --side buy|sell, --type limit|stop')
+        error = usecases.validate_order(currency, amount, side == BUY)
+        if error:
+            raise ValueError(error)
+        if price <= 0:
+            raise ValueError('Цена должна быть положительным числом')
+
+        pair = f'{currency.upper()}_USD'
+        with self._lock, file_lock(self.lock_path):
+            self._load()
+            self._recover()
+            order = {
+                'id': self._next_id,
+                'user_id': user_id,
+                'user': username,
+                'side': side,
+                'type': kind,
+                'pair': pair,
+                'currency': currency.upper(),
+                'amount': float(amount),
+                'price': float(price),
+                'status': OPEN,
+                'created_at': _now_iso()
+            }
+            self._next_id += 1
+            self._orders[order['id']] = order
+            self._push(order)
+            self._save()
+
+        current = get_rates_snapshot(constants.RATES_PATH).get(currency, 'USD')
+        if current is not None:
+            closed = self.match(pair, float(current['rate']), _now_iso())
+            self._publish(closed)
+            for record in closed:
+                if record['id'] == order['id']:
+                    return record
+        return dict(order)
+
+    def cancel(self, user_id: int, order_id: int) -> bool:
+        """Отменяет открытый ордер пользователя; False, если такого нет."""
+        with self._lock, file_lock(self.lock_path):
+            self._load()
+            self._recover()
+            order = self._orders.get(order_id)
+            if order is None or order['user_id'] != user_id:
+                return False
+            self._append_closed([{**order, 'status': CANCELLED, 'closed_at': _now_iso()}])
+            del self._orders[order_id]
+            self._closed_ids.add(order_id)
+            self._save()
+        return True
+
+    def list(self, user_id: int, include_closed: bool = False) -> List[Dict[str, Any]]:
+        """Открытые ордера пользователя; с include_closed — и закрытые из журнала."""
+        result = [dict(o) for o in self._load().values() if o['user_id'] == user_id]
+        if include_closed:
+            records, _ = read_events(self.closed_path)
+            result += [_public(r) for r in records if r['user_id'] == user_id]
+        return sorted(result, key=lambda o: o['id'])
+
+    def _pop_triggered(self, pair: str, rate: float) -> List[int]:
+        """Снимает с куч пары ордера, условие которых выполнено при курсе rate."""
+        triggered = []
+        rise = self._heaps.get((pair, RISE), [])
+        while rise and rise[0][0] <= rate:
+            triggered.append(heapq.heappop(rise)[1])
+        fall = self._heaps.get((pair, FALL), [])
+        while fall and -fall[0][0] >= rate:
+            triggered.append(heapq.heappop(fall)[1])
+        return sorted(triggered)
+
+    def _fill(self, order: Dict[str, Any], rate: float, ts: str) -> Dict[str, Any]:
+        """Исполняет снятый с кучи ордер; любая ошибка сделки отклоняет его."""
+        record = {**order, 'closed_at': ts}
+
+        def write_intent(trade: Dict[str, Any]) -> None:
+            after = {code: money.wallet_minor(trade['wallets'][code], code) if code in trade['wallets'] else None
+                     for code in trade['minor_before']}
+            filled = {**record, 'status': FILLED, 'fill_rate': rate, 'amount_usd': trade['amount_usd'],
+                      'fill': {'before': trade['minor_before'], 'after': after}}
+            self._append_closed([filled])
+            record.update(filled)
+
+        fill = _fill_buy if order['side'] == BUY else _fill_sell
+        try:
+            fill(user=order['user'], currency_code=order['currency'], amount=order['amount'],
+                 is_buy=order['side'] == BUY, rate=rate, before_save=write_intent)
+        except Exception as e:
+            if record.get('status') == FILLED:
+                # Намерение уже в журнале, портфель не сохранён — доисполнит _recover
+                self._dangling[order['id']] = record
+            else:
+                record.update(status=REJECTED, message=str(e))
+                self._append_closed([record])
+        self._closed_ids.add(order['id'])
+        return _public(record)
+
+    def match(self, pair: str, rate: float, ts: str) -> List[Dict[str, Any]]:
+        """Исполняет ордера пары, сработавшие при курсе rate."""
+        with self._lock, file_lock(self.lock_path):
+            self._load()
+            self._recover()
+            closed = []
+            try:
+                for order_id in self._pop_triggered(pair, rate):
+                    order = self._orders.pop(order_id, None)
+                    if order is not None:  # иначе отменён — ленивое удаление из кучи
+                        closed.append(self._fill(order, rate, ts))
+            except Exception:
+                # Снятые с кучи, но не закрытые ордера вернутся при перечитывании файла
+                self._signature = None
+                raise
+            finally:
+                if closed:
+                    self._save()
+            return closed
+
+    def on_events(self, events: List[Dict[str, Any]], bus: Optional[EventBus] = None) -> List[Dict[str, Any]]:
+        """Подписчик шины: проверяет ордера пар с новым курсом."""
+        closed = []
+        for event in events:
+            if event.get('type') == RATE_CHANGE:
+                closed.extend(self.match(event['pair'], float(event['new']), event['ts']))
+        self._publish(closed, bus)
+        return closed
+
+    @staticmethod
+    def _publish(closed: List[Dict[str, Any]], bus: Optional[EventBus] = None) -> None:
+        if closed:
+            (bus or get_bus()).publish([{'type': ORDER_FILLED, 'ts': o['closed_at'], **o} for o in closed])
+
+    def take_closed(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        Исполненные или отклонённые ордера пользователя, о которых он ещё не уведомлён.
+
+        Очередь пользователя забирается и удаляется целиком; пока её нет,
+        проверка стоит один stat.
+        """
+        path = self._pending_path(user_id)
+        if not path.exists():
+            return []
+        with self._lock, file_lock(self.lock_path):
+            fresh, _ = read_events(str(path))
+            path.unlink(missing_ok=True)
+        return fresh
+
+
+def _public(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Запись ордера без служебных полей журнала."""
+    return {k: v for k, v in record.items() if k not in ('fill', 'notified')}
+
+
+def _redo_fill(record: Dict[str, Any]) -> None:
+    """
+    Доисполняет записанное в журнал исполнение, если портфель его не получил.
+
+    Под блокировкой пользователя сравнивает балансы затронутых кошельков
+    с записанными «до» и «после»: «после» — сделка сохранена, «до» — балансы
+    выставляются в «после». Иначе портфель менялся с тех пор, и исполнение
+    только логируется.
+    """
+    user_id, fill = record['user_id'], record['fill']
+    repo = repositories.get_portfolios_repo()
+    with locking.user_lock(user_id):
+        portfolio = repo.get(user_id)
+        if portfolio is None:
+            return
+        wallets = portfolio['wallets']
+        current = {code: money.wallet_minor(wallets[code], code) if code in wallets else None
+                   for code in fill['after']}
+        if current == fill['after']:
+            return
+        if current != fill['before']:
+            decorators.logger.error(f"ORDER_RECOVER order={record['id']} user_id={user_id} "
+                                    f"result=ERROR error_message='portfolio changed since the fill'")
+            return
+        portfolio = models.Portfolio(user_id, wallets)
+        for code, minor in fill['after'].items():
+            if minor is not None:
+                portfolio.add_currency(code)
+                money.set_wallet_minor(wallets[code], code, minor)
+        repo.save(portfolio.new_portfolio)
+        decorators.logger.info(f"ORDER_RECOVER order={record['id']} user_id={user_id} result=OK")
+
+
+_book: Optional[OrderBook] = None
+
+
+def get_book() -> OrderBook:
+    global _book
+    if _book is None:
+        _book = OrderBook()
+    return _book
+
+
+def subscribe(bus: Optional[EventBus] = None) -> OrderBook:
+    """Подключает исполнение отложенных ордеров к шине событий процесса."""
+    bus = bus or get_bus()
+    book = get_book()
+    bus.subscribe(book.on_events)
+    return book
@@ -1,97 +1,133 @@
-from valutatrade_hub.core import models, constants, utils, exceptions
-import json
+import csv
+from typing import Callable, Iterable, List, Optional
+from valutatrade_hub.core import models, constants, money, utils, exceptions
 from valutatrade_hub import decorators
+from valutatrade_hub.infra import locking, repositories
+from valutatrade_hub.parser_service.snapshot import get_rates_snapshot
 
 
 def process_trade(user: str, currency: str, amount: float, is_buy: bool) -> None:
     """
     Выполняет покупку или продажу валюты.
     Обновляет кошельки и сохраняет портфель.
+
+    Чтение, изменение и запись портфеля выполняются под блокировкой
+    пользователя, поэтому параллельные сделки не теряют обновлений.
+    Устаревший курс пары обновляется до блокировки (utils.ensure_fresh_rate).
     """
+    _, user_id = utils.find_wallet_by_username(user)
+    utils.ensure_fresh_rate(currency, 'USD')
+    with locking.user_lock(user_id):
+        _process_trade(user, currency, amount, is_buy)
+
+
+def _process_trade(user: str, currency: str, amount: float, is_buy: bool) -> None:
+    """Сделка без блокировки: вызывается из process_trade."""
     wallets, user_id = utils.find_wallet_by_username(user)
 
-    with open(constants.RATES_PATH, 'r', encoding='utf-8') as f:
-        rates = json.load(f)
+    rate = get_rates_snapshot(constants.RATES_PATH).cross.rate(currency, 'USD')
+    try:
+        trade = _apply_trade(wallets, user_id, currency, amount, is_buy, rate)
+    except ValueError as e:
+        print(e)
+        return
+
+    if is_buy:
+        print(f'Покупка выполнена: {amount:.4f} {currency} '
+              f'по курсу {rate:.2f} {currency}/USD')
+        s = 'стоимость покупки'
+    else:
+        print(f'Продажа выполнена: {amount:.4f} {currency} '
+              f'по курсу {rate:.2f} {currency}/USD')
+        s = 'выручка'
+
+    print('Изменения в портфеле:')
+    print(f'- {currency}: было {trade["before"]:.4f} → стало {trade["after"]:.4f}')
+    print(f'Оценочная {s}: {trade["amount_usd"]:,.2f} USD')
+
+    new_p = models.Portfolio(user_id, trade['wallets'])
+    repositories.get_portfolios_repo().save(new_p.new_portfolio)
 
-    pairs = rates['pairs']
-    convert_string = f'{currency}_USD'
+
+def _apply_trade(
+    wallets: dict, user_id: int, currency: str, amount: float, is_buy: bool, rate: Optional[float]
+) -> dict:
+    """
+    Применяет сделку к кошелькам (без ввода-вывода).
+
+    Расчёт идёт в целых минимальных единицах (money): стоимость покупки
+    округляется вверх, выручка от продажи — вниз. Возвращает {'wallets',
+    'before', 'after', 'amount_usd'}. Сделка, которую нельзя выполнить, —
+    ValueError с сообщением для пользователя; нехватка USD при покупке —
+    InsufficientFundsError.
+    """
+    quantity = money.to_minor(amount, currency)
+    if quantity <= 0:
+        raise ValueError(f'"amount" меньше минимальной единицы {currency}.')
 
     if not is_buy:
         if currency not in wallets:
-            print(f'У вас нет кошелька "{currency}". '
-                  'Добавьте валюту: она создаётся автоматически при первой покупке.')
-            return 
+            raise ValueError(f'У вас нет кошелька "{currency}". '
+                             'Добавьте валюту: она создаётся автоматически при первой покупке.')
+
+        if quantity > money.wallet_minor(wallets[currency], currency):
+            raise ValueError(f'Недостаточно средств: доступно {wallets[currency]["balance"]} {currency}, '
+                             f'требуется {amount} {currency}')
 
-        if amount > wallets[currency]['balance']:
-            print(f'Недостаточно средств: доступно {wallets[currency]["balance"]} {currency}, '
-                  f'требуется {amount} {currency}')
-            return
+    if rate is None:
+        raise ValueError(f'Нет курса {currency} → USD.')
 
-    if convert_string not in pairs:
-        print(f'Нет курса {currency} → USD.')
-        return 
+    amount_usd = money.convert(quantity, currency, rate, 'USD', money.UP if is_buy else money.DOWN)
+
+    if 'USD' not in wallets:
+        raise ValueError('Сначала создайте кошелёк в USD.')
 
-    rate = pairs[convert_string]['rate']
-    amount_usd = amount * rate 
+    # Списание проверяется до изменения кошельков: отклонённая сделка их не трогает
+    if is_buy:
+        wallet = models.Wallet('USD', minor=money.wallet_minor(wallets['USD'], 'USD'))
+        wallet.withdraw_minor(amount_usd)
+    else:
+        wallet = models.Wallet(currency, minor=money.wallet_minor(wallets[currency], currency))
+        wallet.withdraw_minor(quantity)
 
     if currency not in wallets:
         portfolio = models.Portfolio(user_id, wallets)
         portfolio.add_currency(currency)
         wallets = portfolio.wallets
 
-    if 'USD' not in wallets:
-        print('Сначала создайте кошелёк в USD.')
-        return
-
+    before = wallets[currency]['balance']
     if is_buy:
-        try:
-            wallet = models.Wallet('USD', wallets['USD']['balance'])
-            wallet.withdraw(amount_usd)
-        except exceptions.InsufficientFundsError as e:
-            raise e
-        before = wallets[currency]['balance']
-        wallets[currency]['balance'] += amount
-        wallets['USD']['balance'] = wallet.balance
-        print(f'Покупка выполнена: {amount:.4f} {currency} '
-              f'по курсу {rate:.2f} {currency}/USD')
-        s = 'стоимость покупки'
+        bought = money.wallet_minor(wallets[currency], currency) + quantity
+        money.set_wallet_minor(wallets[currency], currency, bought)
+        money.set_wallet_minor(wallets['USD'], 'USD', wallet.minor)
     else:
-        try:
-            wallet = models.Wallet(currency, wallets[currency]['balance'])
-            wallet.withdraw(amount)      
-        except exceptions.InsufficientFundsError as e:
-            raise e
-        before = wallets[currency]['balance']
-        wallets[currency]['balance'] = wallet.balance
-        wallets['USD']['balance'] += amount_usd
-        print(f'Продажа выполнена: {amount:.4f} {currency} '
-              f'по курсу {rate:.2f} {currency}/USD')
-        s = 'выручка'
+        money.set_wallet_minor(wallets[currency], currency, wallet.minor)
+        proceeds = money.wallet_minor(wallets['USD'], 'USD') + amount_usd
+        money.set_wallet_minor(wallets['USD'], 'USD', proceeds)
 
-    print('Изменения в портфеле:')
-    print(f'- {currency}: было {before:.4f} → стало {wallets[currency]["balance"]:.4f}')
-    print(f'Оценочная {s}: {amount_usd:,.2f} USD')
+    return {
+        'wallets': wallets,
+        'before': before,
+        'after': wallets[currency]['balance'],
+        'amount_usd': money.to_amount(amount_usd, 'USD')
+    }
 
-    new_p = models.Portfolio(user_id, wallets)
-    portfolios = utils.safe_load_json(constants.PORTFOLIOS_PATH)
-    for p in portfolios:
-        if p['user_id'] == user_id:
-            p.update(new_p.new_portfolio)
-            break
 
-    with open(constants.PORTFOLIOS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(portfolios, f, indent=4, ensure_ascii=False)
+def validate_order(currency_code: str, amount: float, is_buy: bool) -> Optional[str]:
+    """Проверка параметров ордера до сделки: сообщение об ошибке или None."""
+    if currency_code == 'USD':
+        return 'Нельзя покупать USD.' if is_buy else 'Нельзя продавать USD.'
+    if amount <= 0:
+        return '"amount" должен быть положительным числом.'
+    return None
 
 
 @decorators.log_action('BUY_CURRENCY')
 def buy(currency_code: str, amount: float) -> None:
     """Покупает валюту за USD. Декорируется логом действия."""
-    if currency_code == 'USD':
-        print('Нельзя покупать USD.')
-        return
-
-    if amount <= 0:
-        print('"amount" должен быть положительным числом.')
+    error = validate_order(currency_code, amount, is_buy=True)
+    if error:
+        print(error)
         return
     try:
         process_trade(constants.CURRENT_SESSION, currency_code, amount, is_buy=True)
@@ -102,12 +138,9 @@ def buy(currency_code: str, amount: float) -> None:
 @decorators.log_action('SELL_CURRENCY')
 def sell(currency_code: str, amount: float) -> None:
     """Продаёт валюту на USD. Декорируется логом действия."""
-    if currency_code == 'USD':
-        print('Нельзя продавать USD.')
-        return
-
-    if amount <= 0:
-        print('"amount" должен быть положительным числом.')
+    error = validate_order(currency_code, amount, is_buy=False)
+    if error:
+        print(error)
         return
 
     try:
@@ -116,13 +149,170 @@ def sell(currency_code: str, amount: float) -> None:
         print(e)
 
 
+def execute_trade(*, user: str, currency_code: str, amount: float, is_buy: bool,
+                  rate: Optional[float] = None,
+                  before_save: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Сделка без вывода на экран (для отложенных ордеров) под блокировкой пользователя.
+
+    rate — курс исполнения (по умолчанию из кэша, устаревший обновляется). Отказ — ValueError
+    или InsufficientFundsError, как в _apply_trade. before_save(trade) вызывается под той же
+    блокировкой до сохранения портфеля; trade['minor_before'] — минимальные единицы
+    затронутых кошельков до сделки (None — кошелька не было).
+    """
+    error = validate_order(currency_code, amount, is_buy)
+    if error:
+        raise ValueError(error)
+    _, user_id = utils.find_wallet_by_username(user)
+    if rate is None:
+        utils.ensure_fresh_rate(currency_code, 'USD')
+    with locking.user_lock(user_id):
+        wallets, _ = utils.find_wallet_by_username(user)
+        if rate is None:
+            rate = get_rates_snapshot(constants.RATES_PATH).cross.rate(currency_code, 'USD')
+        minor_before = {code: money.wallet_minor(wallets[code], code) if code in wallets else None
+                        for code in (currency_code, 'USD')}
+        trade = _apply_trade(wallets, user_id, currency_code, amount, is_buy, rate)
+        if before_save is not None:
+            before_save({**trade, 'minor_before': minor_before})
+        repositories.get_portfolios_repo().save(models.Portfolio(user_id, trade['wallets']).new_portfolio)
+    return trade
+
+
+def _execute_order(state: dict, *, user: str, currency_code: str, amount: float,
+                   rate: Optional[float], is_buy: bool) -> dict:
+    """Один ордер пакета над загруженными кошельками state[user_id]."""
+    error = validate_order(currency_code, amount, is_buy)
+    if error:
+        raise ValueError(error)
+    user_id = state['users'][user]
+    trade = _apply_trade(state['wallets'][user_id], user_id, currency_code, amount, is_buy, rate)
+    state['wallets'][user_id] = trade['wallets']
+    return trade
+
+
+_batch_buy = decorators.log_action('BUY_CURRENCY')(_execute_order)
+_batch_sell = decorators.log_action('SELL_CURRENCY')(_execute_order)
+
+
+def load_orders(path: str) -> List[dict]:
+    """
+    Читает ордера из CSV с заголовком side,currency,amount[,user].
+
+    side — buy или sell. Ордера исполняются от текущего пользователя;
+    колонка user, если есть, должна с ним совпадать (см. execute_batch).
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        missing = {'side', 'currency', 'amount'} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f'В файле ордеров нет колонок: {", ".join(sorted(missing))}')
+        return [
+            {key.strip(): (value or '').strip() for key, value in row.items() if key}
+            for row in reader
+        ]
+
+
+def execute_batch(orders: Iterable[dict], user: str) -> List[dict]:
+    """
+    Исполняет пакет ордеров пользователя user за один цикл чтения/записи.
+
+    Портфель и курсы читаются один раз, ордера применяются по порядку
+    с той же проверкой, что и buy/sell (нехватка средств —
+    InsufficientFundsError, ордер отклоняется, остальные исполняются),
+    портфель сохраняется одной записью в конце. Каждый ордер пишется
+    в лог действий через log_action. Строки, где в колонке user указан
+    другой пользователь, отклоняются: пакет не торгует чужими кошельками.
+    На время пакета удерживается блокировка пользователя.
+
+    Возвращает по результату на ордер: line, user, side, currency, amount,
+    status (ok/error), rate, amount_usd, balance, message.
+    """
+    orders = list(orders)
+    rates = get_rates_snapshot(constants.RATES_PATH)
+
+    results = []
+    touched = False
+    _, user_id = utils.find_wallet_by_username(user)
+    with locking.user_lock(user_id):
+        wallets, _ = utils.find_wallet_by_username(user)
+        state = {'users': {user: user_id}, 'wallets': {user_id: wallets}}
+
+        for line, order in enumerate(orders, start=1):
+            side = (order.get('side') or '').lower()
+            currency = (order.get('currency') or '').upper()
+            result = {'line': line, 'user': user, 'side': side, 'currency': currency,
+                      'amount': order.get('amount'), 'status': 'error', 'rate': None,
+                      'amount_usd': None, 'balance': None, 'message': ''}
+            results.append(result)
+            if order.get('user') and order['user'].lower() != user.lower():
+                result['message'] = f"Ордер от имени другого пользователя ('{order['user']}') отклонён."
+                continue
+            try:
+                amount = float(order.get('amount') or '')
+            except ValueError:
+                result['message'] = f'Некорректное количество: {order.get("amount")!r}'
+                continue
+            if side not in ('buy', 'sell'):
+                result['message'] = f'Неизвестная операция: {side!r} (нужно buy или sell)'
+                continue
+            if not currency:
+                result['message'] = 'Не указана валюта.'
+                continue
+
+            rate = rates.cross.rate(currency, 'USD') if currency in rates.cross else None
+            execute = _batch_buy if side == 'buy' else _batch_sell
+            try:
+                trade = execute(state, user=user, currency_code=currency, amount=amount,
+                                rate=rate, is_buy=side == 'buy')
+            except (ValueError, exceptions.InsufficientFundsError) as e:
+                result['message'] = str(e)
+                continue
+            touched = True
+            result.update(status='ok', rate=rate, amount_usd=round(trade['amount_usd'], 8),
+                          balance=trade['after'])
+
+        if touched:
+            repositories.get_portfolios_repo().save(models.Portfolio(user_id, state['wallets'][user_id]).new_portfolio)
+    return results
+
+
+def write_batch_report(path: str, results: List[dict]) -> None:
+    """Отчёт пакета: CSV, по строке на ордер."""
+    fields = ['line', 'user', 'side', 'currency', 'amount', 'status', 'rate', 'amount_usd', 'balance', 'message']
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def migrate_balances() -> int:
+    """
+    Переводит балансы всех портфелей в целые минимальные единицы (поле minor).
+
+    Записи без minor и так читаются через money.wallet_minor; миграция
+    фиксирует округлённые значения в хранилище. Каждый портфель перечитывается
+    и сохраняется под блокировкой своего пользователя, поэтому параллельная
+    сделка не теряется. Возвращает число изменённых портфелей.
+    """
+    repo = repositories.get_portfolios_repo()
+    migrated = 0
+    for user_id in [portfolio['user_id'] for portfolio in repo.iter_all()]:
+        with locking.user_lock(user_id):
+            portfolio = repo.get(user_id)
+            if portfolio is not None and money.migrate_wallets(portfolio['wallets']):
+                repo.save(portfolio)
+                migrated += 1
+    return migrated
+
+
 def get_rate(from_code: str, to_code: str):
     result = utils.fetch_from_parser(from_code, to_code)
     if not result[0]:
         print("Курс не найден")
         return
 
-    rate, date, updated_at = result
+    rate, date, updated_at, status = result
     time_part = updated_at.split('T')[1].rstrip('Z')  # "18:07:07"
-    print(f"Курс {from_code} → {to_code}: {rate:.8f} (обновлено: {date} {time_part})")
+    print(f"Курс {from_code} → {to_code}: {rate:.8f} (обновлено: {date} {time_part}, {status})")
     print(f"Обратный курс {to_code} → {from_code}: {1/rate:.8f}")
\ No newline at end of file
@@ -1,8 +1,14 @@
 import json
-from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
+import logging
+import os
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
 from valutatrade_hub.core import constants
-from valutatrade_hub.parser_service.updater import RatesUpdater
+from valutatrade_hub.infra import repositories
+from valutatrade_hub.parser_service.updater import BUSY, refresh_single_flight, source_for_pair
+from valutatrade_hub.parser_service.snapshot import get_rates_snapshot
 
 
 def safe_load_json(path: str) -> list:
@@ -19,85 +25,183 @@ def safe_load_json(path: str) -> list:
     return data
 
 
+def atomic_write_json(path: str, data: Any, indent: int = 4, durable: bool = False) -> None:
+    """
+    Атомарно записывает JSON: пишет во временный файл и подменяет им исходный.
+
+    durable=True — временный файл и каталог синхронизируются (fsync), так что
+    после возврата новая версия переживёт сбой питания, а не только процесса.
+    """
+    path = Path(path)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with tmp.open('w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if durable:
+        fsync_dir(path.parent)
+
+
+def fsync_dir(path: str) -> None:
+    """Синхронизирует каталог, чтобы переименования в нём стали устойчивыми."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def find_wallet_by_username(username: str) -> tuple[dict, int]:
     """Находит кошельки и ID по имени."""
-    portfolios = safe_load_json(constants.PORTFOLIOS_PATH)
-    users = safe_load_json(constants.USERS_PATH)
+    user = repositories.get_users_repo().get_by_username(username)
+    if user is None:
+        raise ValueError(f"Пользователь '{username}' не найден.")
 
-    user_id = None
-    for user in users:
-        if user.get('username') == username:
-            user_id = user['user_id']
-            break
+    user_id = user['user_id']
+    portfolio = repositories.get_portfolios_repo().get(user_id)
+    if portfolio is None:
+        raise ValueError(f"Портфель для пользователя ID {user_id} не найден.")
+    return portfolio['wallets'], user_id
 
-    if user_id is None:
-        raise ValueError(f"Пользователь '{username}' не найден.")
 
-    for portfolio in portfolios:
-        if portfolio.get('user_id') == user_id:
-            return portfolio['wallets'], user_id
+FRESH = 'fresh'          # моложе мягкого TTL: ответ из кэша
+STALE = 'stale'          # между мягким и жёстким TTL: ответ из кэша + фоновое обновление
+REFRESHED = 'refreshed'  # старше жёсткого TTL или нет в кэше: синхронное обновление
+EXPIRED = 'expired'
+
+_refresh_lock = threading.Lock()
+_refresh_thread: Optional[threading.Thread] = None
 
-    raise ValueError(f"Портфель для пользователя ID {user_id} не найден.")
+
+def rate_age(updated_at_str: str) -> Optional[float]:
+    """Возраст курса в секундах или None, если время не разобрать."""
+    try:
+        value = updated_at_str[:-1] if updated_at_str.endswith('Z') else updated_at_str
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - dt).total_seconds()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def freshness(
+    updated_at_str: str,
+    soft_ttl: int = constants.RATES_TTL_SECONDS,
+    hard_ttl: int = constants.RATES_HARD_TTL_SECONDS
+) -> str:
+    """FRESH — моложе soft_ttl, STALE — моложе hard_ttl, иначе EXPIRED."""
+    age = rate_age(updated_at_str)
+    if age is None or age > hard_ttl:
+        return EXPIRED
+    return FRESH if age <= soft_ttl else STALE
 
 
 def is_fresh(updated_at_str: str) -> bool:
-    """Проверяет свежесть курсов"""
+    """Проверяет свежесть курсов (мягкий TTL из RATES_TTL_SECONDS)."""
+    return freshness(updated_at_str) == FRESH
+
+
+def _background_update(is_fresh: Optional[Callable[[], bool]], source: Optional[str]) -> None:
     try:
-        dt = datetime.fromisoformat(updated_at_str.replace('Z', '+00:00'))
-        now_utc = datetime.now(timezone.utc)
-        return now_utc - dt <= timedelta(minutes=5)
+        # Если курсы уже обновляет другой процесс — не ждём и не дублируем запрос
+        refresh_single_flight(is_fresh, wait=0, source=source)
     except Exception as e:
-        print(f"[DEBUG] is_fresh error: {e}, updated_at: {updated_at_str}")
-        return False
+        logging.getLogger('parser').error(f'Background refresh failed: {e}')
+
+
+def start_background_refresh(
+    is_fresh: Optional[Callable[[], bool]] = None,
+    source: Optional[str] = None
+) -> bool:
+    """
+    Запускает обновление курсов (всех или одного источника source) в фоновом потоке.
+
+    Одновременно идёт не больше одного обновления; возвращает False,
+    если оно уже выполняется.
+    """
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return False
+        _refresh_thread = threading.Thread(
+            target=_background_update, args=(is_fresh, source), name='rates-refresh', daemon=True
+        )
+        _refresh_thread.start()
+        return True
 
 
 def load_cached_rate(source: str, to: str) -> Optional[Dict[str, Any]]:
     """Ищет курс в кэше. Возвращает {'rate', 'updated_at'} или None."""
-    try:
-        with open(constants.RATES_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return None
+    return get_rates_snapshot(constants.RATES_PATH).lookup(source, to)
 
-    pairs = data.get('pairs', {})
-    key = f'{source.upper()}_{to.upper()}'
-    reverse_key = f'{to.upper()}_{source.upper()}'
 
-    if key in pairs:
-        return {
-            'rate': pairs[key]['rate'],
-            'updated_at': pairs[key]['updated_at']
-        }
-    if reverse_key in pairs:
-        return {
-            'rate': 1 / pairs[reverse_key]['rate'],
-            'updated_at': pairs[reverse_key]['updated_at']
-        }
-    return None
+def _pair_fresh_check(source: str, to: str) -> Callable[[], bool]:
+    """Проверка «курс пары уже свежий» для повторного вызова под арендой обновления."""
+    def pair_is_fresh() -> bool:
+        current = load_cached_rate(source, to)
+        return bool(current) and freshness(current['updated_at']) == FRESH
+    return pair_is_fresh
 
 
-def fetch_from_parser(source: str, to: str):
-    """Запрашивает данные с сервера, если кэш устарел"""
+def ensure_fresh_rate(source: str, to: str) -> str:
+    """
+    Политика TTL для сделок (без вывода на экран): свежий курс не трогает,
+    устаревший обновляет в фоне, старше жёсткого TTL или отсутствующий —
+    синхронно «в один полёт». Обновляется только источник пары
+    (source_for_pair). Возвращает статус курса до обновления.
+    """
     source, to = source.upper(), to.upper()
-
     cached = load_cached_rate(source, to)
-    if cached and is_fresh(cached['updated_at']):
-        rate = cached['rate']
-        updated_at = cached['updated_at']
-        date = updated_at.split('T')[0]
-        print(f"Из кэша (свежий): {source}→{to} = {rate}")
-        return rate, date, updated_at
+    status = freshness(cached['updated_at']) if cached else EXPIRED
+    if status == STALE:
+        start_background_refresh(_pair_fresh_check(source, to), source_for_pair(source, to))
+    elif status == EXPIRED:
+        refresh_single_flight(_pair_fresh_check(source, to), source=source_for_pair(source, to))
+    return status
 
-    print("Кэш устарел → обновляю...")
-    updater = RatesUpdater()
-    updater.run_update()
 
+def fetch_from_parser(source: str, to: str):
+    """
+    Возвращает курс (rate, date, updated_at, status) по политике TTL.
+
+    status: FRESH — кэш моложе мягкого TTL; STALE — кэш старше мягкого,
+    но моложе жёсткого TTL: ответ сразу из кэша, обновление идёт в фоне;
+    REFRESHED — кэш старше жёсткого TTL или курса нет: обновление синхронно;
+    EXPIRED — синхронное обновление не удалось, отдан устаревший курс.
+    """
+    source, to = source.upper(), to.upper()
+    pair_is_fresh = _pair_fresh_check(source, to)
+
+    # Обновляется только источник этой пары: курсы другого остаются в кэше
+    provider = source_for_pair(source, to)
     cached = load_cached_rate(source, to)
+    status = freshness(cached['updated_at']) if cached else EXPIRED
+    if status == FRESH:
+        print(f"Из кэша (свежий): {source}→{to} = {cached['rate']}")
+    elif status == STALE:
+        start_background_refresh(pair_is_fresh, provider)
+        print(f"Из кэша (устарел, обновляется в фоне): {source}→{to} = {cached['rate']}")
+    else:
+        print("Кэш устарел → обновляю...")
+        # Одно обращение к API на все процессы: остальные ждут и перечитывают снимок
+        outcome = refresh_single_flight(pair_is_fresh, source=provider)
+        refreshed = load_cached_rate(source, to)
+        if refreshed and refreshed['updated_at'] != (cached or {}).get('updated_at'):
+            cached, status = refreshed, REFRESHED
+            print(f"Обновлено: {source} → {to} = {cached['rate']}")
+        elif outcome == BUSY and cached:
+            print("Курсы обновляет другой процесс — используется кэш.")
+        elif refreshed:
+            cached = refreshed
+            print("Обновить курсы не удалось — используется кэш.")
+
     if not cached:
-        return None, None, None
+        return None, None, None, None
 
     rate = cached['rate']
     updated_at = cached['updated_at']
     date = updated_at.split('T')[0]
-    print(f"Обновлено: {source} → {to} = {rate}")
-    return rate, date, updated_at
\ No newline at end of file
+    return rate, date, updated_at, status
@@ -0,0 +1,105 @@
+from array import array
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from valutatrade_hub.core import money
+from valutatrade_hub.infra import repositories
+from valutatrade_hub.parser_service.crossrates import CrossRates
+from valutatrade_hub.parser_service.snapshot import RatesSnapshot
+
+
+class BalanceMatrix(NamedTuple):
+    """Балансы всех пользователей: строка — пользователь, столбец — валюта."""
+    user_ids: np.ndarray               # int64, (n,)
+    currencies: Tuple[str, ...]        # (m,)
+    balances: np.ndarray               # float64, (n, m)
+
+    @classmethod
+    def from_portfolios(cls, portfolios: Iterable[dict]) -> 'BalanceMatrix':
+        """
+        Собирает матрицу за один проход по портфелям.
+
+        Балансы берутся в целых минимальных единицах (money.wallet_minor —
+        как в Portfolio.get_total_value), копятся в плоских массивах
+        (строка, столбец, значение), раскладываются в целочисленную матрицу
+        одной векторной операцией и переводятся в суммы делением на масштаб
+        столбца.
+        """
+        columns: dict = {}
+        user_ids = array('q')
+        rows, cols, values = array('q'), array('q'), array('q')
+        for row, portfolio in enumerate(portfolios):
+            user_ids.append(int(portfolio['user_id']))
+            for code, wallet in portfolio['wallets'].items():
+                code = code.upper()
+                rows.append(row)
+                cols.append(columns.setdefault(code, len(columns)))
+                values.append(money.wallet_minor(wallet, code))
+
+        minor = np.zeros((len(user_ids), len(columns)), dtype=np.int64)
+        np.add.at(
+            minor,
+            (np.frombuffer(rows, dtype=np.int64), np.frombuffer(cols, dtype=np.int64)),
+            np.frombuffer(values, dtype=np.int64)
+        )
+        scales = np.array([10.0 ** money.scale(code) for code in columns], dtype=np.float64)
+        balances = minor / scales
+        return cls(np.frombuffer(user_ids, dtype=np.int64).copy(), tuple(columns), balances)
+
+
+def load_balances(repo: Optional[repositories.PortfoliosRepository] = None) -> BalanceMatrix:
+    """Загружает портфели всех пользователей из репозитория в матрицу."""
+    repo = repo or repositories.get_portfolios_repo()
+    return BalanceMatrix.from_portfolios(repo.iter_all())
+
+
+def rate_vector(currencies: Iterable[str], cross: CrossRates, base: str) -> np.ndarray:
+    """Курсы валют в base по матрице кросс-курсов; NaN — курса нет."""
+    rates = [cross.rate(code, base) for code in currencies]
+    return np.array([np.nan if r is None else r for r in rates], dtype=np.float64)
+
+
+class ValuationReport(NamedTuple):
+    """Результат пакетной оценки портфелей в базовой валюте."""
+    base: str
+    user_ids: np.ndarray               # (n,)
+    totals: np.ndarray                 # стоимость портфеля каждого пользователя, (n,)
+    currencies: Tuple[str, ...]
+    holdings: np.ndarray               # сумма балансов по валюте, (m,)
+    aum: np.ndarray                    # то же в базовой валюте, (m,)
+    unpriced: Tuple[str, ...]          # валюты без курса в base (в оценку не вошли)
+
+    @property
+    def total_aum(self) -> float:
+        return float(self.aum.sum())
+
+    def leaderboard(self, top: int = 10) -> List[Tuple[int, float]]:
+        """Топ-N пользователей по стоимости портфеля: [(user_id, total), ...]."""
+        top = min(top, len(self.totals))
+        if top <= 0:
+            return []
+        idx = np.argpartition(-self.totals, top - 1)[:top]
+        idx = idx[np.argsort(-self.totals[idx], kind='stable')]
+        return [(int(self.user_ids[i]), float(self.totals[i])) for i in idx]
+
+
+def value_portfolios(matrix: BalanceMatrix, rates: RatesSnapshot, base: str) -> ValuationReport:
+    """
+    Оценивает все портфели разом: balances (n×m) @ rates (m) → totals (n).
+
+    Валюты без курса в base считаются по нулевому курсу и перечисляются
+    в unpriced.
+    """
+    base = base.upper()
+    vector = rate_vector(matrix.currencies, rates.cross, base)
+    priced = ~np.isnan(vector)
+    vector = np.where(priced, vector, 0.0)
+    holdings = matrix.balances.sum(axis=0)
+    return ValuationReport(
+        base=base,
+        user_ids=matrix.user_ids,
+        totals=matrix.balances @ vector,
+        currencies=matrix.currencies,
+        holdings=holdings,
+        aum=holdings * vector,
+        unpriced=tuple(code for code, ok in zip(matrix.currencies, priced) if not ok)
+    )
@@ -20,9 +20,11 @@ def log_action(action_name, verbose=False):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            user = kwargs.get('user') or (args[0] if args else 'unknown')
-            currency = kwargs.get('currency_code') or (args[0] if args else 'unknown')
-            amount = kwargs.get('amount') or (args[1] if len(args) > 1 else 0)
+            # Первый позиционный аргумент buy/sell — код валюты, а не пользователь
+            user = kwargs.get('user') or constants.CURRENT_SESSION or 'unknown'
+            # Явно переданные currency_code/amount берутся как есть, даже пустые
+            currency = kwargs['currency_code'] if 'currency_code' in kwargs else (args[0] if args else 'unknown')
+            amount = kwargs['amount'] if 'amount' in kwargs else (args[1] if len(args) > 1 else 0)
             rate = kwargs.get('rate', None)
             base = constants.BASE_CURRENCY
             
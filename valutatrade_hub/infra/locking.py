@@ -0,0 +1,84 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import ContextManager, Iterator
+from valutatrade_hub.core import constants
+
+try:
+    import fcntl
+except ImportError:  # Windows: advisory-блокировок через fcntl нет
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """
+    Advisory-блокировка на файле path (fcntl.flock), общая для всех процессов.
+
+    shared=True — разделяемая блокировка (чтение), иначе эксклюзивная.
+    Блокировка снимается при выходе из контекста или смерти процесса.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextmanager
+def try_file_lock(path: str, timeout: float = 0.0, poll: float = 0.05) -> Iterator[bool]:
+    """
+    Эксклюзивная блокировка с ограниченным ожиданием: отдаёт True, если
+    её удалось взять за timeout секунд, иначе False.
+
+    Взявший блокировку записывает в файл свой pid и время — это аренда:
+    она действует, пока процесс держит файл, и снимается ОС при его смерти.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    acquired = fcntl is None
+    try:
+        deadline = time.monotonic() + timeout
+        while not acquired:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(poll)
+        if acquired:
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, json.dumps({'pid': os.getpid(), 'since': time.time()}).encode(), 0)
+        yield acquired
+    finally:
+        if acquired and fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def named_lock(name: str) -> ContextManager[None]:
+    """Эксклюзивная межпроцессная блокировка LOCKS_DIR/<name>.lock."""
+    return file_lock(named_lock_path(name))
+
+
+def named_lock_path(name: str) -> str:
+    """Путь файла именованной блокировки LOCKS_DIR/<name>.lock."""
+    return str(Path(constants.LOCKS_DIR) / f'{name}.lock')
+
+
+def user_lock(user_id: int) -> ContextManager[None]:
+    """
+    Блокировка данных одного пользователя.
+
+    Сделки разных пользователей идут параллельно, сделки одного
+    пользователя выполняются по очереди и не затирают друг друга.
+    """
+    return named_lock(f'user-{int(user_id)}')
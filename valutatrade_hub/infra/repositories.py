@@ -0,0 +1,280 @@
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+from copy import deepcopy
+from pathlib import Path
+from typing import Iterator, Optional
+from valutatrade_hub.core import constants, utils
+from valutatrade_hub.infra.locking import file_lock
+
+
+class UsersRepository(ABC):
+    """Абстрактное хранилище пользователей. Записи — словари как в users.json."""
+
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[dict]:
+        """Возвращает пользователя по имени или None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        """Возвращает пользователя по ID или None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def next_user_id(self) -> int:
+        """Возвращает ID для нового пользователя."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, user: dict) -> None:
+        """Сохраняет нового пользователя."""
+        raise NotImplementedError
+
+
+class PortfoliosRepository(ABC):
+    """Абстрактное хранилище портфелей: {'user_id': ..., 'wallets': {...}}."""
+
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[dict]:
+        """Возвращает портфель пользователя или None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, portfolio: dict) -> None:
+        """Создаёт или заменяет портфель пользователя."""
+        raise NotImplementedError
+
+    def save_many(self, portfolios: list[dict]) -> None:
+        """Сохраняет несколько портфелей; бэкенды могут делать это одной записью."""
+        for portfolio in portfolios:
+            self.save(portfolio)
+
+    @abstractmethod
+    def iter_all(self) -> Iterator[dict]:
+        """Перебирает все портфели (только для чтения — без копирования)."""
+        raise NotImplementedError
+
+
+class _IndexedJsonList(ABC):
+    """
+    JSON-массив, разобранный в память вместе с индексами.
+
+    Файл перечитывается и индексы перестраиваются, только если изменились
+    его mtime или размер, — иначе поиск идёт по словарю за O(1).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self.records: list = []
+        self._signature = None
+
+    def _stat(self) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    @abstractmethod
+    def _rebuild_index(self) -> None:
+        """Перестраивает индексы по self.records."""
+        raise NotImplementedError
+
+    def _refresh(self) -> None:
+        """Перечитывает файл, если он изменился с момента последнего чтения."""
+        signature = self._stat()
+        if signature != self._signature or signature is None:
+            self.records = utils.safe_load_json(self.path)
+            self._rebuild_index()
+            self._signature = signature
+
+    def _flush(self) -> None:
+        """Атомарно и устойчиво (с fsync) сохраняет записи и запоминает подпись файла."""
+        utils.atomic_write_json(self.path, self.records, durable=True)
+        self._signature = self._stat()
+
+
+class JsonUsersRepository(_IndexedJsonList, UsersRepository):
+    """
+    Пользователи в users.json с индексами username → позиция и user_id → позиция.
+
+    Поиск возвращает копию записи: изменения вызывающего кода не портят кэш и индексы.
+    """
+
+    def __init__(self, path: str = constants.USERS_PATH):
+        super().__init__(path)
+        self._by_username: dict = {}
+        self._by_id: dict = {}
+        self._max_id = 0
+
+    def _rebuild_index(self) -> None:
+        self._by_username = {}
+        self._by_id = {}
+        self._max_id = 0
+        for pos, user in enumerate(self.records):
+            self._index_user(pos, user)
+
+    def _index_user(self, pos: int, user: dict) -> None:
+        self._by_username[user.get('username')] = pos
+        self._by_id[user.get('user_id')] = pos
+        self._max_id = max(self._max_id, user.get('user_id') or 0)
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        self._refresh()
+        pos = self._by_username.get(username)
+        return dict(self.records[pos]) if pos is not None else None
+
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        self._refresh()
+        pos = self._by_id.get(user_id)
+        return dict(self.records[pos]) if pos is not None else None
+
+    def next_user_id(self) -> int:
+        self._refresh()
+        return self._max_id + 1
+
+    def add(self, user: dict) -> None:
+        with file_lock(self.lock_path):
+            self._refresh()
+            user = dict(user)
+            self.records.append(user)
+            self._index_user(len(self.records) - 1, user)
+            self._flush()
+
+
+class JsonPortfoliosRepository(_IndexedJsonList, PortfoliosRepository):
+    """Портфели в portfolios.json с индексом user_id → позиция в массиве."""
+
+    def __init__(self, path: str = constants.PORTFOLIOS_PATH):
+        super().__init__(path)
+        self._by_user_id: dict = {}
+
+    def _rebuild_index(self) -> None:
+        self._by_user_id = {p.get('user_id'): pos for pos, p in enumerate(self.records)}
+
+    def get(self, user_id: int) -> Optional[dict]:
+        self._refresh()
+        pos = self._by_user_id.get(user_id)
+        return deepcopy(self.records[pos]) if pos is not None else None
+
+    def save(self, portfolio: dict) -> None:
+        self.save_many([portfolio])
+
+    def save_many(self, portfolios: list[dict]) -> None:
+        # Файл общий для всех: перечитываем под блокировкой, чтобы не затереть чужие изменения
+        with file_lock(self.lock_path):
+            self._refresh()
+            for portfolio in portfolios:
+                pos = self._by_user_id.get(portfolio['user_id'])
+                if pos is None:
+                    self._by_user_id[portfolio['user_id']] = len(self.records)
+                    self.records.append(deepcopy(portfolio))
+                else:
+                    self.records[pos].update(deepcopy(portfolio))
+            self._flush()
+
+    def iter_all(self) -> Iterator[dict]:
+        self._refresh()
+        yield from list(self.records)
+
+
+class ShardedJsonPortfoliosRepository(PortfoliosRepository):
+    """
+    Портфели по одному файлу на пользователя: PORTFOLIOS_DIR/<user_id>.json.
+
+    Сделка читает и атомарно подменяет только файл своего пользователя,
+    поэтому объём ввода-вывода не зависит от числа остальных пользователей.
+    При первом запуске portfolios.json раскладывается по файлам.
+    """
+
+    def __init__(
+        self,
+        directory: str = constants.PORTFOLIOS_DIR,
+        legacy_path: str = constants.PORTFOLIOS_PATH
+    ):
+        self.directory = Path(directory)
+        if not self.directory.exists():
+            self._migrate_legacy(legacy_path)
+
+    def _migrate_legacy(self, legacy_path: str) -> None:
+        """Раскладывает записи portfolios.json по отдельным файлам."""
+        tmp_dir = self.directory.with_name(f'{self.directory.name}.{os.getpid()}.tmp')
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        for portfolio in utils.safe_load_json(legacy_path):
+            utils.atomic_write_json(tmp_dir / f"{portfolio['user_id']}.json", portfolio)
+        try:
+            os.rename(tmp_dir, self.directory)
+        except OSError:
+            # Каталог успел создать другой процесс — его данные и используем
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _shard(self, user_id: int) -> Path:
+        return self.directory / f'{int(user_id)}.json'
+
+    def get(self, user_id: int) -> Optional[dict]:
+        try:
+            with self._shard(user_id).open('r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self, portfolio: dict) -> None:
+        utils.atomic_write_json(self._shard(portfolio['user_id']), portfolio, durable=True)
+
+    def iter_all(self) -> Iterator[dict]:
+        for path in self.directory.glob('*.json'):
+            try:
+                with path.open('r', encoding='utf-8') as f:
+                    yield json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+
+
+_users_repo: Optional[UsersRepository] = None
+_portfolios_repo: Optional[PortfoliosRepository] = None
+
+
+def json_portfolios_repo() -> PortfoliosRepository:
+    """
+    Портфели JSON-бэкенда: раскладка из PORTFOLIOS_LAYOUT, поверх неё —
+    журнал сделок (TRADE_JOURNAL, по умолчанию включён).
+    """
+    if (constants.PORTFOLIOS_LAYOUT or 'single').lower() == 'sharded':
+        portfolios = ShardedJsonPortfoliosRepository()
+    else:
+        portfolios = JsonPortfoliosRepository()
+    if constants.TRADE_JOURNAL:
+        from valutatrade_hub.infra.trade_journal import JournaledPortfoliosRepository
+        portfolios = JournaledPortfoliosRepository(portfolios)
+    return portfolios
+
+
+def _create_repos() -> tuple[UsersRepository, PortfoliosRepository]:
+    """Создаёт репозитории для бэкенда из STORAGE_BACKEND ('json' или 'sqlite')."""
+    backend = (constants.STORAGE_BACKEND or 'json').lower()
+    if backend == 'json':
+        return JsonUsersRepository(), json_portfolios_repo()
+    if backend == 'sqlite':
+        from valutatrade_hub.infra import sqlite_storage
+        db = sqlite_storage.get_database()
+        return sqlite_storage.SqliteUsersRepository(db), sqlite_storage.SqlitePortfoliosRepository(db)
+    raise ValueError(f'Неизвестный STORAGE_BACKEND: {backend}')
+
+
+def get_users_repo() -> UsersRepository:
+    """Возвращает репозиторий пользователей выбранного бэкенда."""
+    global _users_repo, _portfolios_repo
+    if _users_repo is None:
+        _users_repo, _portfolios_repo = _create_repos()
+    return _users_repo
+
+
+def get_portfolios_repo() -> PortfoliosRepository:
+    """Возвращает репозиторий портфелей выбранного бэкенда."""
+    global _users_repo, _portfolios_repo
+    if _portfolios_repo is None:
+        _users_repo, _portfolios_repo = _create_repos()
+    return _portfolios_repo
@@ -17,8 +17,21 @@ class SettingsLoader:
     DATA_PATH = PROJECT_ROOT / 'data'
     USERS_PATH = DATA_PATH / 'users.json'
     PORTFOLIOS_PATH = DATA_PATH / 'portfolios.json'
+    PORTFOLIOS_DIR = DATA_PATH / 'portfolios'
     RATES_PATH = DATA_PATH / 'rates.json'
     EXCHANGE_RATES_PATH = DATA_PATH / 'exchange_rates.json'
+    EXCHANGE_RATES_LOG_PATH = DATA_PATH / 'exchange_rates.jsonl'
+    EXCHANGE_RATES_COLUMNS_DIR = DATA_PATH / 'history_columns'
+    EXCHANGE_RATES_SEGMENTS_DIR = DATA_PATH / 'history_segments'
+    SQLITE_PATH = DATA_PATH / 'valutatrade.db'
+    TRADE_JOURNAL_PATH = DATA_PATH / 'trades.journal'
+    LOCKS_DIR = DATA_PATH / 'locks'
+    SCHEDULER_STATUS_PATH = DATA_PATH / 'scheduler_status.json'
+    HTTP_CACHE_PATH = DATA_PATH / 'http_cache.json'
+    BREAKER_STATE_PATH = DATA_PATH / 'breakers.json'
+    EVENTS_PATH = DATA_PATH / 'events.jsonl'
+    ALERTS_PATH = DATA_PATH / 'alerts.json'
+    ORDERS_PATH = DATA_PATH / 'orders.json'
 
     LOG_DIR = PROJECT_ROOT / 'logs'
     ACTIONS_LOG = LOG_DIR / 'actions.log'
@@ -27,9 +40,27 @@ class SettingsLoader:
         'DATA_PATH': str(DATA_PATH),
         'USERS_PATH': str(USERS_PATH),
         'PORTFOLIOS_PATH': str(PORTFOLIOS_PATH),
+        'PORTFOLIOS_DIR': str(PORTFOLIOS_DIR),
+        'PORTFOLIOS_LAYOUT': 'single',
         'RATES_PATH': str(RATES_PATH),
         'EXCHANGE_RATES_PATH': str(EXCHANGE_RATES_PATH),
+        'EXCHANGE_RATES_LOG_PATH': str(EXCHANGE_RATES_LOG_PATH),
+        'EXCHANGE_RATES_COLUMNS_DIR': str(EXCHANGE_RATES_COLUMNS_DIR),
+        'EXCHANGE_RATES_SEGMENTS_DIR': str(EXCHANGE_RATES_SEGMENTS_DIR),
         'RATES_TTL_SECONDS': 300,
+        'RATES_HARD_TTL_SECONDS': 3600,
+        'STORAGE_BACKEND': 'json',
+        'SQLITE_PATH': str(SQLITE_PATH),
+        'TRADE_JOURNAL': True,
+        'TRADE_JOURNAL_PATH': str(TRADE_JOURNAL_PATH),
+        'TRADE_CHECKPOINT_EVERY': 100,
+        'LOCKS_DIR': str(LOCKS_DIR),
+        'SCHEDULER_STATUS_PATH': str(SCHEDULER_STATUS_PATH),
+        'HTTP_CACHE_PATH': str(HTTP_CACHE_PATH),
+        'BREAKER_STATE_PATH': str(BREAKER_STATE_PATH),
+        'EVENTS_PATH': str(EVENTS_PATH),
+        'ALERTS_PATH': str(ALERTS_PATH),
+        'ORDERS_PATH': str(ORDERS_PATH),
         "LOG_DIR": str(LOG_DIR),
         "ACTIONS_LOG_PATH": str(ACTIONS_LOG),
         "LOG_FORMAT": "[{time}] {level}: {message}",
@@ -80,8 +111,12 @@ class SettingsLoader:
             self._config = json.load(f)
 
     def get(self, key, default=None):
-        """Получает значение из конфига."""
-        return self._config.get(key, default)
+        """
+        Получает значение из конфига.
+
+        Ключи, которых нет в старом config.json, берутся из DEFAULT_CONFIG.
+        """
+        return self._config.get(key, self.DEFAULT_CONFIG.get(key, default))
 
     def __repr__(self):
         return f'SettingsLoader(config_path="{self.config_path}")'
\ No newline at end of file
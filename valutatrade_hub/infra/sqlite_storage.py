@@ -0,0 +1,229 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from valutatrade_hub.core import constants, money, utils
+from valutatrade_hub.infra.repositories import UsersRepository, PortfoliosRepository, json_portfolios_repo
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS storage_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    hashed_password TEXT NOT NULL,
+    salt TEXT NOT NULL,
+    registration_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS portfolios (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id INTEGER NOT NULL,
+    currency_code TEXT NOT NULL,
+    balance REAL NOT NULL,
+    minor INTEGER,
+    PRIMARY KEY (user_id, currency_code)
+);
+CREATE TABLE IF NOT EXISTS rates_history (
+    id TEXT PRIMARY KEY,
+    pair TEXT NOT NULL,
+    from_currency TEXT NOT NULL,
+    to_currency TEXT NOT NULL,
+    rate REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    source TEXT,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_rates_history_pair_ts ON rates_history (pair, timestamp);
+CREATE INDEX IF NOT EXISTS idx_rates_history_ts ON rates_history (timestamp);
+"""
+
+
+class SqliteDatabase:
+    """
+    Соединение с SQLite-базой (WAL) и схема хранилища.
+
+    Одно соединение на процесс; доступ из потоков сериализуется блокировкой.
+    """
+
+    def __init__(self, path: str = constants.SQLITE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        # Базы, созданные до появления minor: колонка добавляется на месте
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(wallets)')}
+        if 'minor' not in columns:
+            self.conn.execute('ALTER TABLE wallets ADD COLUMN minor INTEGER')
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Открывает транзакцию: commit при успехе, rollback при исключении."""
+        with self.lock, self.conn:
+            yield self.conn
+
+    def get_flag(self, key: str) -> Optional[str]:
+        """Читает служебное значение из storage_meta."""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value FROM storage_meta WHERE key = ?', (key,)
+            ).fetchone()
+        return row['value'] if row else None
+
+    def set_flag(self, conn: sqlite3.Connection, key: str, value: str) -> None:
+        """Записывает служебное значение в рамках текущей транзакции."""
+        conn.execute(
+            'INSERT OR REPLACE INTO storage_meta (key, value) VALUES (?, ?)',
+            (key, value)
+        )
+
+
+class SqliteUsersRepository(UsersRepository):
+    """Пользователи в таблице users (индексы по user_id и username)."""
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+
+    def _fetch_one(self, where: str, value) -> Optional[dict]:
+        with self.db.lock:
+            row = self.db.conn.execute(
+                'SELECT user_id, username, hashed_password, salt, registration_date '
+                f'FROM users WHERE {where} = ?', (value,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        return self._fetch_one('username', username)
+
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        return self._fetch_one('user_id', user_id)
+
+    def next_user_id(self) -> int:
+        with self.db.lock:
+            row = self.db.conn.execute('SELECT COALESCE(MAX(user_id), 0) + 1 FROM users').fetchone()
+        return row[0]
+
+    def add(self, user: dict) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                'INSERT INTO users (user_id, username, hashed_password, salt, registration_date) '
+                'VALUES (:user_id, :username, :hashed_password, :salt, :registration_date)',
+                user
+            )
+
+
+class SqlitePortfoliosRepository(PortfoliosRepository):
+    """Портфели в таблицах portfolios и wallets (строка на кошелёк)."""
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+
+    def get(self, user_id: int) -> Optional[dict]:
+        with self.db.lock:
+            exists = self.db.conn.execute(
+                'SELECT 1 FROM portfolios WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            if not exists:
+                return None
+            rows = self.db.conn.execute(
+                'SELECT currency_code, balance, minor FROM wallets WHERE user_id = ?', (user_id,)
+            ).fetchall()
+        wallets = {row['currency_code']: _wallet_from_row(row) for row in rows}
+        return {'user_id': user_id, 'wallets': wallets}
+
+    def save(self, portfolio: dict) -> None:
+        self.save_many([portfolio])
+
+    def save_many(self, portfolios: list[dict]) -> None:
+        with self.db.transaction() as conn:
+            for portfolio in portfolios:
+                _write_portfolio(conn, portfolio)
+
+    def iter_all(self) -> Iterator[dict]:
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                'SELECT p.user_id, w.currency_code, w.balance, w.minor FROM portfolios p '
+                'LEFT JOIN wallets w ON w.user_id = p.user_id ORDER BY p.user_id'
+            ).fetchall()
+        portfolio = None
+        for row in rows:
+            if portfolio is None or portfolio['user_id'] != row['user_id']:
+                if portfolio is not None:
+                    yield portfolio
+                portfolio = {'user_id': row['user_id'], 'wallets': {}}
+            if row['currency_code'] is not None:
+                portfolio['wallets'][row['currency_code']] = _wallet_from_row(row)
+        if portfolio is not None:
+            yield portfolio
+
+
+def _wallet_from_row(row: sqlite3.Row) -> dict:
+    wallet = {'currency_code': row['currency_code'], 'balance': row['balance']}
+    if row['minor'] is not None:
+        wallet['minor'] = row['minor']
+    return wallet
+
+
+def _write_portfolio(conn: sqlite3.Connection, portfolio: dict) -> None:
+    """Заменяет портфель и все его кошельки в рамках транзакции."""
+    user_id = portfolio['user_id']
+    conn.execute('INSERT OR IGNORE INTO portfolios (user_id) VALUES (?)', (user_id,))
+    conn.execute('DELETE FROM wallets WHERE user_id = ?', (user_id,))
+    conn.executemany(
+        'INSERT INTO wallets (user_id, currency_code, balance, minor) VALUES (?, ?, ?, ?)',
+        [
+            (user_id, code, float(data['balance']), money.wallet_minor(data, code))
+            for code, data in portfolio['wallets'].items()
+        ]
+    )
+
+
+def migrate_from_json(
+    db: SqliteDatabase,
+    users_path: str = constants.USERS_PATH,
+    portfolios_repo: Optional[PortfoliosRepository] = None
+) -> tuple[int, int]:
+    """
+    Однократно переносит пользователей и портфели JSON-бэкенда в SQLite.
+
+    Портфели читаются через хранилище JSON-бэкенда (json_portfolios_repo),
+    поэтому переносятся и файлы раскладки sharded, и хвост журнала сделок,
+    ещё не сброшенный checkpoint'ом. Повторный вызов ничего не делает
+    (флаг json_migrated в storage_meta). Возвращает число перенесённых
+    пользователей и портфелей.
+    """
+    if db.get_flag('json_migrated'):
+        return 0, 0
+
+    users = utils.safe_load_json(users_path)
+    portfolios = list((portfolios_repo or json_portfolios_repo()).iter_all())
+    with db.transaction() as conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO users (user_id, username, hashed_password, salt, registration_date) '
+            'VALUES (:user_id, :username, :hashed_password, :salt, :registration_date)',
+            users
+        )
+        for portfolio in portfolios:
+            _write_portfolio(conn, portfolio)
+        db.set_flag(conn, 'json_migrated', '1')
+    return len(users), len(portfolios)
+
+
+_database: Optional[SqliteDatabase] = None
+
+
+def get_database() -> SqliteDatabase:
+    """Возвращает общее для процесса соединение; при первом открытии переносит JSON-данные."""
+    global _database
+    if _database is None:
+        _database = SqliteDatabase()
+        migrate_from_json(_database)
+    return _database
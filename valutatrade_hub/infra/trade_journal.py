@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+from copy import deepcopy
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+from valutatrade_hub.core import constants
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.infra.repositories import PortfoliosRepository
+
+
+class TradeJournal:
+    """
+    Журнал сделок (write-ahead log) в формате JSON Lines.
+
+    Запись — одна строка с новым состоянием кошельков пользователя.
+    fsync выполняется с групповой фиксацией: пока один поток синхронизирует
+    файл, остальные дописывают свои записи и ждут, после чего один fsync
+    подтверждает всю накопившуюся группу.
+    """
+
+    def __init__(self, path: str = constants.TRADE_JOURNAL_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_name(f'{self.path.name}.lock')
+        self._cond = threading.Condition()
+        self._file = None
+        self._inode = None
+        self._written_lsn = 0
+        self._durable_lsn = 0
+        self._syncing = False
+        self._retired = []
+        self._open()
+
+    def _open(self) -> None:
+        """(Пере)открывает файл журнала на дозапись."""
+        if self._file:
+            # Старый файл может как раз синхронизировать commit(): закроется после fsync
+            if self._syncing:
+                self._retired.append(self._file)
+            else:
+                self._file.close()
+        self._file = open(self.path, 'ab')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+
+    def inode(self) -> Optional[int]:
+        """Inode текущего файла журнала на диске (меняется при checkpoint)."""
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def append(self, record: dict) -> int:
+        """Дописывает запись (без fsync). Возвращает её номер для commit()."""
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with file_lock(self.lock_path), self._cond:
+            if self.inode() != self._inode:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            self._written_lsn += 1
+            return self._written_lsn
+
+    def commit(self, lsn: int) -> None:
+        """
+        Дожидается, пока запись lsn станет устойчивой (групповой fsync).
+
+        Перед fsync под блокировкой журнала проверяется, что открытый файл
+        всё ещё текущий. Если другой процесс уже заменил его в checkpoint,
+        записи из него сброшены в базовое хранилище с fsync — синхронизировать
+        нечего.
+        """
+        with self._cond:
+            while self._durable_lsn < lsn:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written_lsn
+                file, inode = self._file, self._inode
+                self._cond.release()
+                try:
+                    with file_lock(self.lock_path):
+                        current = self.inode() == inode
+                    if current:
+                        os.fsync(file.fileno())
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    for retired in self._retired:
+                        retired.close()
+                    self._retired.clear()
+                    self._durable_lsn = max(self._durable_lsn, target)
+                    self._cond.notify_all()
+
+    def read(self, offset: int = 0) -> tuple[list[dict], int]:
+        """Читает целые строки начиная с offset. Возвращает записи и новое смещение."""
+        records = []
+        try:
+            with self.path.open('rb') as f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    offset += len(raw)
+                    try:
+                        records.append(json.loads(raw))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return records, offset
+
+    def reset(self) -> None:
+        """Заменяет журнал пустым файлом (вызывается под блокировкой после checkpoint)."""
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        tmp.write_bytes(b'')
+        os.replace(tmp, self.path)
+        with self._cond:
+            self._open()
+            self._durable_lsn = self._written_lsn
+
+
+class JournaledPortfoliosRepository(PortfoliosRepository):
+    """
+    Портфели поверх журнала сделок.
+
+    save() — одна последовательная дозапись в журнал и групповой fsync;
+    последние состояния портфелей держатся в памяти поверх базового
+    хранилища. Раз в checkpoint_every записей они сбрасываются
+    в базовое хранилище одной записью, а журнал обнуляется. При запуске
+    хвост журнала после последнего checkpoint проигрывается в память
+    (без записи в базовое хранилище) — записи содержат итоговое состояние,
+    поэтому повтор безопасен; в хранилище он попадёт со следующим checkpoint.
+    """
+
+    def __init__(
+        self,
+        base: PortfoliosRepository,
+        journal: Optional[TradeJournal] = None,
+        checkpoint_every: int = constants.TRADE_CHECKPOINT_EVERY
+    ):
+        self.base = base
+        self.journal = journal or TradeJournal()
+        self.checkpoint_every = checkpoint_every
+        self._lock = threading.RLock()
+        self._overlay: dict = {}
+        self._inode = None
+        self._offset = 0
+        self._pending = 0
+        self._catch_up()
+        # Хвост уже учитывается в счётчике до следующего checkpoint
+        self._pending = len(self._overlay)
+
+    def _catch_up(self) -> None:
+        """Дочитывает записи журнала, добавленные этим или другими процессами."""
+        inode = self.journal.inode()
+        if inode != self._inode:
+            # Журнал заменён после checkpoint: всё прочитанное уже в базовом хранилище
+            self._overlay.clear()
+            self._inode, self._offset = inode, 0
+        records, self._offset = self.journal.read(self._offset)
+        for record in records:
+            self._overlay[record['user_id']] = record['wallets']
+
+    def get(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            self._catch_up()
+            if user_id in self._overlay:
+                return {'user_id': user_id, 'wallets': deepcopy(self._overlay[user_id])}
+            return self.base.get(user_id)
+
+    def iter_all(self) -> Iterator[dict]:
+        with self._lock:
+            self._catch_up()
+            overlay = dict(self._overlay)
+        for portfolio in self.base.iter_all():
+            wallets = overlay.pop(portfolio['user_id'], None)
+            yield portfolio if wallets is None else {'user_id': portfolio['user_id'], 'wallets': wallets}
+        for user_id, wallets in overlay.items():
+            yield {'user_id': user_id, 'wallets': wallets}
+
+    def save(self, portfolio: dict) -> None:
+        self.save_many([portfolio])
+
+    def save_many(self, portfolios: list[dict]) -> None:
+        """Пакет портфелей — записи подряд и один общий fsync."""
+        if not portfolios:
+            return
+        ts = datetime.now(timezone.utc).isoformat()
+        lsn = 0
+        for portfolio in portfolios:
+            lsn = self.journal.append({
+                'ts': ts,
+                'user_id': portfolio['user_id'],
+                'wallets': portfolio['wallets']
+            })
+        self.journal.commit(lsn)
+        with self._lock:
+            self._catch_up()
+            self._pending += len(portfolios)
+            if self._pending >= self.checkpoint_every:
+                self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """
+        Сбрасывает состояния из журнала в базовое хранилище и обнуляет журнал.
+
+        JSON-хранилища пишут портфели с fsync файла и каталога, поэтому журнал
+        обнуляется только после того, как его содержимое устойчиво на диске.
+        """
+        with self._lock, file_lock(self.journal.lock_path):
+            self._catch_up()
+            if self._overlay:
+                self.base.save_many([
+                    {'user_id': user_id, 'wallets': wallets}
+                    for user_id, wallets in self._overlay.items()
+                ])
+            self.journal.reset()
+            self._overlay.clear()
+            self._inode, self._offset = self.journal.inode(), 0
+            self._pending = 0
@@ -1,15 +1,169 @@
+import re
+import threading
+import time
 from abc import ABC, abstractmethod
 import requests
-from typing import Tuple, Dict
+from requests.adapters import HTTPAdapter
+from typing import Any, Tuple, Dict, Optional
 from time import perf_counter
 from valutatrade_hub.parser_service.config import ParserConfig
-from valutatrade_hub.core import exceptions
+from valutatrade_hub.core import exceptions, utils
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.parser_service.resilience import CircuitBreaker, RetryPolicy
 
 cfg = ParserConfig()
 
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class HttpCache:
+    """
+    Состояние условных запросов по ключу клиента: ETag, Last-Modified,
+    момент следующего обновления данных у провайдера и последнее тело ответа.
+
+    Хранится в небольшом JSON-файле, общем для всех процессов.
+    """
+
+    def __init__(self, path: str = cfg.HTTP_CACHE_PATH):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        data = utils.safe_load_json(self.path)
+        return data[0] if data and isinstance(data[0], dict) else {}
+
+    def get(self, key: str) -> Dict[str, Any]:
+        return dict(self._load().get(key) or {})
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock, file_lock(self.lock_path):
+            data = self._load()
+            data[key] = entry
+            utils.atomic_write_json(self.path, data, indent=None)
+
 
 class BaseApiClient(ABC):
-    """Абстрактный клиент для получения курсов. Возвращает rates + meta."""
+    """
+    Абстрактный клиент для получения курсов. Возвращает rates + meta.
+
+    Все клиенты ходят через одну keep-alive сессию requests с пулом
+    соединений, поэтому TCP/TLS-соединение с провайдером переиспользуется
+    между обновлениями. Запросы условные: сохранённые ETag/Last-Modified
+    уходят в If-None-Match/If-Modified-Since, а пока не наступил срок
+    следующего обновления у провайдера (max-age, time_next_update),
+    запрос не отправляется вовсе.
+
+    Временные сбои повторяются (RetryPolicy), а провайдер, который раз за
+    разом падает или отвечает слишком медленно, отключается предохранителем
+    (CircuitBreaker) — запросы к нему сразу завершаются ошибкой.
+    """
+
+    _session: Optional[requests.Session] = None
+    _session_lock = threading.Lock()
+
+    config: ParserConfig = cfg
+    http_cache: Optional[HttpCache] = None
+    breaker: Optional[CircuitBreaker] = None
+    retry: Optional[RetryPolicy] = None
+
+    @classmethod
+    def session(cls, config: ParserConfig = cfg) -> requests.Session:
+        """Общая для процесса HTTP-сессия с пулом соединений."""
+        with BaseApiClient._session_lock:
+            if BaseApiClient._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=config.HTTP_POOL_MAXSIZE
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+                BaseApiClient._session = session
+            return BaseApiClient._session
+
+    def _next_update(self, body: Any, resp: requests.Response) -> Optional[float]:
+        """Когда у провайдера появятся новые данные (Unix time) или None."""
+        match = _MAX_AGE.search(resp.headers.get('Cache-Control', ''))
+        return time.time() + int(match.group(1)) if match else None
+
+    def _request_with_retries(
+        self, label: str, url: str, params: Optional[dict], headers: dict
+    ) -> Tuple[requests.Response, int]:
+        """
+        GET с повторами и учётом в предохранителе провайдера label.
+        Возвращает ответ и время последней попытки в мс.
+
+        4xx (кроме 429) — ответ провайдера, а не его сбой: не повторяется
+        и не размыкает цепь, но превращается в ApiRequestError.
+        """
+        breaker = self.breaker or CircuitBreaker(self.config)
+        retry = self.retry or RetryPolicy(self.config)
+        breaker.before_request(label)
+
+        for attempt in range(retry.attempts):
+            resp, error = None, None
+            started = perf_counter()
+            try:
+                resp = self.session(self.config).get(
+                    url, params=params, headers=headers, timeout=self.config.REQUEST_TIMEOUT
+                )
+            except requests.RequestException as e:
+                error = e
+            request_ms = int((perf_counter() - started) * 1000)
+            failed = error is not None or resp.status_code >= 500 or resp.status_code == 429
+            if failed and attempt + 1 < retry.attempts and retry.retryable(error, resp):
+                retry.sleep(retry.delay(attempt, resp))
+                continue
+            break
+
+        breaker.record(label, not failed, request_ms)
+        if error is not None:
+            raise exceptions.ApiRequestError(f'{label} request error: {error}')
+        try:
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            raise exceptions.ApiRequestError(f'{label} request error: {e}')
+        return resp, request_ms
+
+    def _get_json(self, label: str, cache_key: str, url: str, params: dict = None) -> Tuple[Any, int, int]:
+        """
+        Условный GET. Возвращает (тело, status_code, request_ms).
+
+        При 304 возвращается сохранённое тело; если срок следующего
+        обновления ещё не наступил — тоже сохранённое тело, status_code 304
+        и request_ms 0 (запрос не отправлялся).
+        """
+        cache = self.http_cache or HttpCache(self.config.HTTP_CACHE_PATH)
+        entry = cache.get(cache_key)
+        has_body = entry.get('body') is not None
+        if has_body and (entry.get('next_update') or 0) > time.time():
+            return entry['body'], 304, 0
+
+        headers = {}
+        if has_body and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if has_body and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        resp, request_ms = self._request_with_retries(label, url, params, headers)
+
+        if resp.status_code == 304 and has_body:
+            body = entry['body']
+        else:
+            try:
+                body = resp.json()
+            except ValueError:
+                raise exceptions.ApiRequestError(f'{label} returned invalid JSON')
+
+        cache.put(cache_key, {
+            'etag': resp.headers.get('ETag') or entry.get('etag'),
+            'last_modified': resp.headers.get('Last-Modified') or entry.get('last_modified'),
+            'next_update': self._next_update(body, resp),
+            'body': body
+        })
+        return body, resp.status_code, request_ms
 
     @abstractmethod
     def fetch_rates(self) -> Tuple[Dict[str, float], Dict[str, dict]]:
@@ -34,20 +188,8 @@ class CoinGeckoClient(BaseApiClient):
         params = {'ids': ids, 'vs_currencies': self.base}
         url = self.config.COINGECKO_URL
 
-        started = perf_counter()
-        try:
-            resp = requests.get(url, params=params, timeout=self.config.REQUEST_TIMEOUT)
-            resp.raise_for_status()
-        except requests.RequestException as e:
-            raise exceptions.ApiRequestError(f'CoinGecko request error: {e}')
-
-        request_ms = int((perf_counter() - started) * 1000)
-        status = resp.status_code
-
-        try:
-            body = resp.json()
-        except ValueError:
-            raise exceptions.ApiRequestError('CoinGecko returned invalid JSON')
+        cache_key = f'{self.__class__.__name__}:{ids}:{self.base}'
+        body, status, request_ms = self._get_json('CoinGecko', cache_key, url, params)
 
         rates: Dict[str, float] = {}
         meta: Dict[str, dict] = {}
@@ -74,6 +216,12 @@ class ExchangeRateApiClient(BaseApiClient):
         self.config = config
         self.base = config.BASE_CURRENCY
 
+    def _next_update(self, body: Any, resp: requests.Response) -> Optional[float]:
+        """Провайдер обновляет курсы раз в сутки и сообщает время следующего обновления."""
+        if isinstance(body, dict) and body.get('result') == 'success' and body.get('time_next_update_unix'):
+            return float(body['time_next_update_unix'])
+        return super()._next_update(body, resp)
+
     def fetch_rates(self) -> Tuple[Dict[str, float], Dict[str, dict]]:
         """Получает курсы фиата через ExchangeRate-API."""
         key = self.config.EXCHANGERATE_API_KEY
@@ -81,20 +229,8 @@ class ExchangeRateApiClient(BaseApiClient):
             raise exceptions.ApiRequestError('ExchangeRate API key is not set (EXCHANGERATE_API_KEY)')
 
         url = f'{self.config.EXCHANGERATE_API_URL}/{key}/latest/{self.base}'
-        started = perf_counter()
-        try:
-            resp = requests.get(url, timeout=self.config.REQUEST_TIMEOUT)
-            resp.raise_for_status()
-        except requests.RequestException as e:
-            raise exceptions.ApiRequestError(f'ExchangeRate request error: {e}')
-
-        request_ms = int((perf_counter() - started) * 1000)
-        status = resp.status_code
-
-        try:
-            body = resp.json()
-        except ValueError:
-            raise exceptions.ApiRequestError('ExchangeRate API returned invalid JSON')
+        cache_key = f'{self.__class__.__name__}:{self.base}'
+        body, status, request_ms = self._get_json('ExchangeRate', cache_key, url)
 
         if body.get('result') != 'success':
             reason = body.get('error-type') or body.get('result', 'unknown')
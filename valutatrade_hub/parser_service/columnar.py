@@ -0,0 +1,179 @@
+import mmap
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.parser_service.config import ParserConfig
+
+cfg = ParserConfig()
+
+TS_TYPECODE = 'q'    # int64: секунды Unix time
+RATE_TYPECODE = 'd'  # float64
+ITEM_SIZE = 8
+
+
+def to_epoch(timestamp: str) -> int:
+    """Переводит ISO-время записи истории ('...Z' или '...+00:00Z') в секунды UTC."""
+    dt = datetime.fromisoformat(timestamp[:-1] if timestamp.endswith('Z') else timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class PairSeries:
+    """
+    Ряд одной пары, отображённый в память только на чтение.
+
+    timestamps и rates — memoryview над mmap: срезы не копируют данные,
+    а numpy.frombuffer(series.rates, dtype='f8') даёт массив без копирования.
+    """
+
+    def __init__(self, ts_path: Path, rate_path: Path):
+        self._maps = []
+        ts = self._map(ts_path)
+        rates = self._map(rate_path)
+        n = min(len(ts) // ITEM_SIZE, len(rates) // ITEM_SIZE)
+        self.timestamps = memoryview(ts)[:n * ITEM_SIZE].cast(TS_TYPECODE)
+        self.rates = memoryview(rates)[:n * ITEM_SIZE].cast(RATE_TYPECODE)
+
+    def _map(self, path: Path):
+        try:
+            with path.open('rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b''
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return b''
+        self._maps.append(mm)
+        return mm
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def range(self, start: Optional[int] = None, end: Optional[int] = None) -> tuple[memoryview, memoryview]:
+        """Срез [start, end] по времени (секунды UTC) бинарным поиском: O(log n) + k."""
+        lo = bisect_left(self.timestamps, start) if start is not None else 0
+        hi = bisect_right(self.timestamps, end) if end is not None else len(self.timestamps)
+        return self.timestamps[lo:hi], self.rates[lo:hi]
+
+    def close(self) -> None:
+        self.timestamps.release()
+        self.rates.release()
+        for mm in self._maps:
+            mm.close()
+        self._maps = []
+
+    def __enter__(self) -> 'PairSeries':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ColumnarRatesStore:
+    """
+    Колоночное хранилище истории курсов: на каждую пару два файла
+    фиксированной ширины — <PAIR>.ts (int64) и <PAIR>.rate (float64),
+    в порядке возрастания времени.
+
+    Запись — дозапись в конец обоих файлов; чтение — через mmap, поэтому
+    несколько процессов делят один страничный кэш ОС.
+    """
+
+    def __init__(self, directory: str = cfg.HISTORY_COLUMNS_DIR):
+        self.directory = Path(directory)
+        self.lock_path = self.directory / '.lock'
+
+    def exists(self) -> bool:
+        return self.directory.exists()
+
+    def _paths(self, pair: str) -> tuple[Path, Path]:
+        return self.directory / f'{pair}.ts', self.directory / f'{pair}.rate'
+
+    def pairs(self) -> List[str]:
+        """Пары, по которым есть данные."""
+        if not self.exists():
+            return []
+        return sorted(p.stem for p in self.directory.glob('*.ts'))
+
+    def open(self, pair: str) -> PairSeries:
+        """Открывает ряд пары для чтения (закрывать через close() или with)."""
+        return PairSeries(*self._paths(pair.upper()))
+
+    @staticmethod
+    def _last_timestamp(ts_path: Path, rows: int) -> Optional[int]:
+        if rows == 0:
+            return None
+        with ts_path.open('rb') as f:
+            f.seek((rows - 1) * ITEM_SIZE)
+            return array(TS_TYPECODE, f.read(ITEM_SIZE))[0]
+
+    def append(self, pair: str, timestamps: Iterable[int], rates: Iterable[float]) -> int:
+        """
+        Дописывает точки пары. Точки не новее последней сохранённой
+        пропускаются, чтобы ряд оставался отсортированным.
+        Возвращает число записанных точек.
+        """
+        ts_path, rate_path = self._paths(pair.upper())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            ts_size = ts_path.stat().st_size if ts_path.exists() else 0
+            rate_size = rate_path.stat().st_size if rate_path.exists() else 0
+            rows = min(ts_size, rate_size) // ITEM_SIZE
+            if ts_size != rows * ITEM_SIZE or rate_size != rows * ITEM_SIZE:
+                # Хвост после прерванной записи — обрезаем до целых строк
+                for path in (ts_path, rate_path):
+                    if path.exists():
+                        os.truncate(path, rows * ITEM_SIZE)
+
+            last = self._last_timestamp(ts_path, rows)
+            ts_col, rate_col = array(TS_TYPECODE), array(RATE_TYPECODE)
+            for ts, rate in zip(timestamps, rates):
+                if last is not None and ts <= last:
+                    continue
+                ts_col.append(ts)
+                rate_col.append(rate)
+                last = ts
+
+            if ts_col:
+                with rate_path.open('ab') as f:
+                    rate_col.tofile(f)
+                with ts_path.open('ab') as f:
+                    ts_col.tofile(f)
+            return len(ts_col)
+
+    def append_entries(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Дописывает записи истории (словари exchange_rates) по их парам."""
+        by_pair = defaultdict(lambda: ([], []))
+        for entry in entries:
+            pair = f"{entry['from_currency']}_{entry['to_currency']}"
+            ts, rates = by_pair[pair]
+            ts.append(to_epoch(entry['timestamp']))
+            rates.append(float(entry['rate']))
+        return sum(self.append(pair, ts, rates) for pair, (ts, rates) in by_pair.items())
+
+    def rebuild(self, history: Iterable[Dict[str, Any]]) -> int:
+        """Строит хранилище заново из полной истории (например, при первом запуске)."""
+        by_pair = defaultdict(list)
+        for entry in history:
+            try:
+                pair = f"{entry['from_currency']}_{entry['to_currency']}"
+                by_pair[pair].append((to_epoch(entry['timestamp']), float(entry['rate'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            for path in self.directory.glob('*.ts'):
+                path.unlink()
+            for path in self.directory.glob('*.rate'):
+                path.unlink()
+        written = 0
+        for pair, points in by_pair.items():
+            points.sort()
+            written += self.append(pair, (p[0] for p in points), (p[1] for p in points))
+        return written
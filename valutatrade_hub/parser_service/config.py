@@ -15,9 +15,14 @@ class ParserConfig:
     # API-ключ из .env
     EXCHANGERATE_API_KEY: str = field(default_factory=lambda: os.getenv("EXCHANGERATE_API_KEY") or "")
 
-    # Эндпоинты
-    COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price"
-    EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6"
+    # Эндпоинты (переопределяются из окружения, например на локальный стенд standin)
+    COINGECKO_URL: str = field(default_factory=lambda: os.getenv("COINGECKO_URL")
+                               or "https://api.coingecko.com/api/v3/simple/price")
+    EXCHANGERATE_API_URL: str = field(default_factory=lambda: os.getenv("EXCHANGERATE_API_URL")
+                                      or "https://v6.exchangerate-api.com/v6")
+
+    # Офлайн-режим без сети: "recorded" (история курсов) или "random_walk"; пусто — реальные API
+    REPLAY_MODE: str = field(default_factory=lambda: os.getenv("RATES_REPLAY") or "")
 
     # Валюты
     BASE_CURRENCY: str = "USD"
@@ -32,6 +37,42 @@ class ParserConfig:
     # Пути к файлам
     RATES_FILE_PATH: str = constants.RATES_PATH
     HISTORY_FILE_PATH: str = constants.EXCHANGE_RATES_PATH
+    HISTORY_LOG_PATH: str = constants.EXCHANGE_RATES_LOG_PATH
+    HISTORY_COLUMNS_DIR: str = constants.EXCHANGE_RATES_COLUMNS_DIR
+    HISTORY_SEGMENTS_DIR: str = constants.EXCHANGE_RATES_SEGMENTS_DIR
 
     # Таймаут запросов
-    REQUEST_TIMEOUT: int = 10
\ No newline at end of file
+    REQUEST_TIMEOUT: int = 10
+    # Общий срок на параллельный опрос всех клиентов в run_update: опоздавшие
+    # клиенты досчитываются в фоне (до REQUEST_TIMEOUT и повторов) и не держат вызов
+    UPDATE_DEADLINE: float = 12.0
+    # Сколько ждать чужое обновление курсов, прежде чем отдать устаревший кэш
+    REFRESH_WAIT: float = 15.0
+
+    # Пул keep-alive соединений общей HTTP-сессии и состояние условных запросов
+    HTTP_POOL_CONNECTIONS: int = 4
+    HTTP_POOL_MAXSIZE: int = 8
+    HTTP_CACHE_PATH: str = constants.HTTP_CACHE_PATH
+
+    # Повторы временных сбоев: число попыток и экспоненциальная пауза (с)
+    RETRY_ATTEMPTS: int = 3
+    RETRY_BACKOFF: float = 0.5
+    RETRY_BACKOFF_MAX: float = 4.0
+
+    # Предохранитель: неудач подряд до размыкания, пауза (с) и порог медленного ответа (мс)
+    BREAKER_FAILURES: int = 3
+    BREAKER_COOLDOWN: float = 60.0
+    BREAKER_COOLDOWN_MAX: float = 900.0
+    BREAKER_SLOW_MS: int = 5000
+    BREAKER_STATE_PATH: str = constants.BREAKER_STATE_PATH
+
+    # Планировщик обновлений: интервал (с), доля случайного разброса и квота
+    # запросов в месяц на источник (ExchangeRate-API free — 1500, CoinGecko Demo — 10000)
+    SCHEDULE: dict = field(default_factory=lambda: {
+        "coingecko": {"interval": 300, "jitter": 0.1, "monthly_quota": 10000, "burst": 30},
+        "exchangerate": {"interval": 3600, "jitter": 0.1, "monthly_quota": 1500, "burst": 5},
+    })
+    SCHEDULER_STATUS_PATH: str = constants.SCHEDULER_STATUS_PATH
+
+    # Журнал событий (изменения курсов, сработавшие оповещения), JSON Lines
+    EVENTS_PATH: str = constants.EVENTS_PATH
\ No newline at end of file
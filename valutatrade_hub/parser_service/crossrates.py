@@ -0,0 +1,85 @@
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+PIVOT_CURRENCY = 'USD'
+
+
+class CrossRates:
+    """
+    Матрица кросс-курсов «каждая в каждую» по графу закэшированных пар.
+
+    Пара FROM_TO даёт два ребра: FROM→TO с курсом rate и TO→FROM с 1/rate.
+    Для каждой валюты поиском в ширину находится кратчайший путь до всех
+    остальных; при равной длине предпочитается путь через USD. Матрица
+    строится один раз на снимок курсов, после чего пересчёт любой
+    валюты в любую — поиск по индексу, O(1).
+    """
+
+    def __init__(self, pairs: Mapping[str, Mapping[str, Any]], pivot: str = PIVOT_CURRENCY):
+        edges: Dict[str, Dict[str, Tuple[float, str]]] = defaultdict(dict)
+        for key, info in pairs.items():
+            try:
+                from_code, to_code = key.upper().split('_')
+                rate = float(info['rate'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if rate <= 0 or from_code == to_code:
+                continue
+            updated_at = info.get('updated_at')
+            edges[from_code][to_code] = (rate, updated_at)
+            # Прямая пара важнее обратной, если в кэше есть обе
+            if f'{to_code}_{from_code}' not in pairs:
+                edges[to_code][from_code] = (1 / rate, updated_at)
+
+        self.pivot = pivot
+        self.currencies: Tuple[str, ...] = tuple(sorted(edges))
+        self.index: Dict[str, int] = {code: i for i, code in enumerate(self.currencies)}
+        n = len(self.currencies)
+        self._rates: List[List[Optional[float]]] = [[None] * n for _ in range(n)]
+        self._updated: List[List[Optional[str]]] = [[None] * n for _ in range(n)]
+        self._hops: List[List[int]] = [[0] * n for _ in range(n)]
+
+        def neighbours(code: str) -> List[str]:
+            # Сначала опорная валюта, затем остальные по алфавиту
+            return sorted(edges[code], key=lambda c: (c != pivot, c))
+
+        for src in self.currencies:
+            i = self.index[src]
+            self._rates[i][i] = 1.0
+            queue = deque([src])
+            while queue:
+                node = queue.popleft()
+                k = self.index[node]
+                for nxt in neighbours(node):
+                    j = self.index[nxt]
+                    if self._rates[i][j] is not None:
+                        continue
+                    rate, updated_at = edges[node][nxt]
+                    self._rates[i][j] = self._rates[i][k] * rate
+                    # Кросс-курс не свежее самого старого курса на пути
+                    self._updated[i][j] = min(filter(None, (self._updated[i][k], updated_at)), default=None)
+                    self._hops[i][j] = self._hops[i][k] + 1
+                    queue.append(nxt)
+
+    def __contains__(self, code: str) -> bool:
+        return code.upper() in self.index
+
+    def rate(self, from_code: str, to_code: str) -> Optional[float]:
+        """Курс FROM→TO или None, если валюты не связаны."""
+        i = self.index.get(from_code.upper())
+        j = self.index.get(to_code.upper())
+        if i is None or j is None:
+            return None
+        return self._rates[i][j]
+
+    def lookup(self, from_code: str, to_code: str) -> Optional[Dict[str, Any]]:
+        """{'rate', 'updated_at', 'hops'} для FROM→TO или None."""
+        i = self.index.get(from_code.upper())
+        j = self.index.get(to_code.upper())
+        if i is None or j is None or self._rates[i][j] is None:
+            return None
+        return {'rate': self._rates[i][j], 'updated_at': self._updated[i][j], 'hops': self._hops[i][j]}
+
+    def reachable(self, from_code: str, to_code: str) -> bool:
+        """Можно ли пересчитать FROM в TO по имеющимся курсам."""
+        return self.rate(from_code, to_code) is not None
@@ -0,0 +1,107 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.parser_service.config import ParserConfig
+
+cfg = ParserConfig()
+logger = logging.getLogger('parser')
+
+RATE_CHANGE = 'rate_change'
+ALERT_TRIGGERED = 'alert_triggered'
+
+Subscriber = Callable[[List[Dict[str, Any]]], None]
+
+
+def rate_change(pair: str, old: Optional[float], new: float, source: str, ts: str) -> Dict[str, Any]:
+    """Событие изменения курса; delta_pct — None для новой пары."""
+    delta = round((new - old) / old * 100, 6) if old else None
+    return {
+        'type': RATE_CHANGE, 'pair': pair, 'old': old, 'new': new,
+        'delta_pct': delta, 'source': source, 'ts': ts
+    }
+
+
+class EventBus:
+    """
+    Шина событий: подписчики в процессе + журнал JSON Lines для других процессов.
+
+    publish() сначала дописывает события в конец файла (под файловой
+    блокировкой, файл не перезаписывается), затем вызывает подписчиков.
+    Ошибка подписчика логируется и не мешает остальным. Другие процессы
+    читают журнал с сохранённого смещения через read_events().
+    """
+
+    def __init__(self, path: str = cfg.EVENTS_PATH):
+        self.path = Path(path)
+        self.lock_path = f'{path}.lock'
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Subscriber) -> None:
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Subscriber) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        """Записывает пачку событий в журнал и раздаёт подписчикам."""
+        if not events:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            lines = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in events)
+            with file_lock(self.lock_path), self.path.open('a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f'Event log write failed: {e}')
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(events)
+            except Exception as e:
+                logger.error(f'Event subscriber {getattr(callback, "__name__", callback)} failed: {e}')
+
+
+def read_events(path: str = cfg.EVENTS_PATH, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    События журнала начиная с байта offset и смещение для следующего чтения.
+
+    Недописанная последняя строка не читается — она достанется следующему вызову.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    end = data.rfind(b'\n') + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events, offset + end
+
+
+_buses: Dict[str, EventBus] = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(path: str = cfg.EVENTS_PATH) -> EventBus:
+    """Общая для процесса шина событий файла path."""
+    key = str(Path(path).resolve())
+    with _buses_lock:
+        bus = _buses.get(key)
+        if bus is None:
+            bus = _buses[key] = EventBus(path)
+        return bus
@@ -0,0 +1,115 @@
+import re
+import time
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+from valutatrade_hub.parser_service.columnar import ColumnarRatesStore
+from valutatrade_hub.parser_service.config import ParserConfig
+
+cfg = ParserConfig()
+
+BUCKETS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '4h': 14400, '1d': 86400}
+
+_RELATIVE = re.compile(r'^(\d+)([mhdw])$')
+_UNIT_SECONDS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_time(value: str, now: Optional[float] = None) -> int:
+    """
+    Переводит границу запроса в секунды UTC.
+
+    Принимает ISO-дату/время ('2025-11-16', '2025-11-16T18:00:00Z')
+    или относительный сдвиг назад от текущего момента ('30m', '24h', '7d', '2w').
+    """
+    value = value.strip()
+    match = _RELATIVE.match(value.lower())
+    if match:
+        now = time.time() if now is None else now
+        return int(now) - int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+    value = value.upper()
+    dt = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def aggregate_bars(points: Iterable[Tuple[int, float]], bucket_seconds: int) -> Iterator[dict]:
+    """
+    Один потоковый проход по отсортированным точкам → бары OHLC + среднее.
+
+    Бар: start (секунды UTC, начало интервала), open, high, low, close, mean, count.
+    """
+    bar = None
+    total = 0.0
+    for ts, rate in points:
+        start = ts - ts % bucket_seconds
+        if bar is None or start != bar['start']:
+            if bar is not None:
+                bar['mean'] = total / bar['count']
+                yield bar
+            bar = {'start': start, 'open': rate, 'high': rate, 'low': rate, 'close': rate, 'count': 0}
+            total = 0.0
+        bar['high'] = max(bar['high'], rate)
+        bar['low'] = min(bar['low'], rate)
+        bar['close'] = rate
+        bar['count'] += 1
+        total += rate
+    if bar is not None:
+        bar['mean'] = total / bar['count']
+        yield bar
+
+
+class HistoryQuery:
+    """
+    Запросы к истории курсов поверх колоночного хранилища.
+
+    Ряд каждой пары отсортирован по времени, поэтому границы диапазона
+    находятся бинарным поиском: запрос стоит O(log n + k).
+    Если прямой пары нет, используется обратная (курс 1/rate).
+    """
+
+    def __init__(self, columns: Optional[ColumnarRatesStore] = None, config: ParserConfig = cfg):
+        self.columns = columns or ColumnarRatesStore(config.HISTORY_COLUMNS_DIR)
+        if not self.columns.exists():
+            from valutatrade_hub.parser_service.storage import get_history_repo
+            self.columns.rebuild(get_history_repo(config).iter_history())
+
+    def points(
+        self,
+        from_code: str,
+        to_code: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """Точки (время, курс) пары в диапазоне [since, until]."""
+        from_code, to_code = from_code.upper(), to_code.upper()
+        pairs = self.columns.pairs()
+        if f'{from_code}_{to_code}' in pairs:
+            pair, invert = f'{from_code}_{to_code}', False
+        elif f'{to_code}_{from_code}' in pairs:
+            pair, invert = f'{to_code}_{from_code}', True
+        else:
+            return []
+
+        with self.columns.open(pair) as series:
+            ts, rates = series.range(since, until)
+            if invert:
+                result = [(t, 1 / r) for t, r in zip(ts, rates)]
+            else:
+                result = list(zip(ts, rates))
+            ts.release()
+            rates.release()
+        return result
+
+    def bars(
+        self,
+        from_code: str,
+        to_code: str,
+        bucket: str = '1h',
+        since: Optional[int] = None,
+        until: Optional[int] = None
+    ) -> List[dict]:
+        """Бары OHLC пары с интервалом bucket ('1m', '1h', '1d', ...)."""
+        if bucket not in BUCKETS:
+            raise ValueError(f'Неизвестный интервал {bucket}. Доступны: {", ".join(BUCKETS)}')
+        return list(aggregate_bars(self.points(from_code, to_code, since, until), BUCKETS[bucket]))
@@ -0,0 +1,125 @@
+import math
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from valutatrade_hub.core import exceptions
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.config import ParserConfig
+
+cfg = ParserConfig()
+
+RECORDED = 'recorded'
+RANDOM_WALK = 'random_walk'
+
+# Стартовые цены, если нет ни истории, ни кэша
+DEFAULT_PRICES = {
+    'BTC_USD': 60000.0, 'ETH_USD': 3000.0, 'SOL_USD': 150.0,
+    'EUR_USD': 1.08, 'GBP_USD': 1.27, 'RUB_USD': 0.011,
+}
+
+
+def recorded_frames(history: Iterable[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """
+    Группирует записи истории по времени в «кадры» {пара: курс}.
+
+    Записи одного обновления имеют общий timestamp, поэтому кадр —
+    это ответ источников в момент этого обновления.
+    """
+    frames: 'OrderedDict[str, Dict[str, float]]' = OrderedDict()
+    for entry in sorted(history, key=lambda e: str(e.get('timestamp', ''))):
+        try:
+            pair = f"{entry['from_currency']}_{entry['to_currency']}"
+            frames.setdefault(str(entry['timestamp'])[:19], {})[pair] = float(entry['rate'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return list(frames.values())
+
+
+class RandomWalk:
+    """
+    Синтетические цены: геометрическое случайное блуждание от стартовых цен.
+
+    На каждом шаге курс умножается на exp(volatility * N(0, 1)).
+    """
+
+    def __init__(self, start: Dict[str, float], volatility: float = 0.001, seed: Optional[int] = None):
+        self.prices = dict(start or DEFAULT_PRICES)
+        self.volatility = volatility
+        self.rng = random.Random(seed)
+
+    def step(self) -> Dict[str, float]:
+        for pair, price in self.prices.items():
+            self.prices[pair] = price * math.exp(self.volatility * self.rng.gauss(0.0, 1.0))
+        return dict(self.prices)
+
+
+def start_prices(config: ParserConfig = cfg) -> Dict[str, float]:
+    """Последние известные курсы: из кэша rates.json, иначе DEFAULT_PRICES."""
+    from valutatrade_hub.parser_service.snapshot import get_rates_snapshot
+    pairs = get_rates_snapshot(config.RATES_FILE_PATH).pairs
+    prices = {pair: float(info['rate']) for pair, info in pairs.items() if info.get('rate')}
+    return prices or dict(DEFAULT_PRICES)
+
+
+class ReplayApiClient(BaseApiClient):
+    """
+    Офлайн-клиент для тестов и нагрузочных прогонов без сети и API-ключа.
+
+    mode='recorded' — по кругу проигрывает кадры из истории курсов
+    (exchange_rates); mode='random_walk' — синтетические цены от последних
+    известных курсов. latency_ms и error_rate имитируют задержку и сбои
+    провайдера.
+    """
+
+    def __init__(
+        self,
+        config: ParserConfig = cfg,
+        mode: str = RANDOM_WALK,
+        frames: Optional[List[Dict[str, float]]] = None,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        volatility: float = 0.001,
+        seed: Optional[int] = None
+    ):
+        self.config = config
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._position = 0
+
+        if mode == RECORDED:
+            if frames is None:
+                from valutatrade_hub.parser_service.storage import get_history_repo
+                frames = recorded_frames(get_history_repo(config).iter_history())
+            if not frames:
+                raise exceptions.ApiRequestError('Replay: no recorded history to replay')
+            self.frames = frames
+        elif mode == RANDOM_WALK:
+            self.walk = RandomWalk(start_prices(config), volatility, seed)
+        else:
+            raise ValueError(f'Unknown replay mode: {mode}')
+
+    def _next_frame(self) -> Dict[str, float]:
+        if self.mode == RECORDED:
+            frame = self.frames[self._position % len(self.frames)]
+            self._position += 1
+            return frame
+        return self.walk.step()
+
+    def fetch_rates(self) -> Tuple[Dict[str, float], Dict[str, dict]]:
+        """Следующий кадр курсов в формате остальных клиентов."""
+        started = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise exceptions.ApiRequestError('Replay: simulated provider failure')
+
+        rates = self._next_frame()
+        request_ms = int((time.perf_counter() - started) * 1000)
+        meta = {
+            pair: {'raw_id': pair, 'request_ms': request_ms, 'status_code': 200, 'source': 'Replay'}
+            for pair in rates
+        }
+        return dict(rates), meta
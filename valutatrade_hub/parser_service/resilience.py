@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+import requests
+from valutatrade_hub.core import exceptions, utils
+from valutatrade_hub.infra.locking import file_lock
+from valutatrade_hub.parser_service.config import ParserConfig
+
+cfg = ParserConfig()
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class CircuitBreaker:
+    """
+    Предохранитель провайдеров с состоянием в JSON-файле (общий для процессов).
+
+    После BREAKER_FAILURES неудач подряд провайдер «размыкается»: запросы
+    к нему сразу завершаются ошибкой до конца паузы. Затем пропускается
+    один пробный запрос (half-open): успех замыкает цепь, неудача снова
+    размыкает её с удвоенной паузой (не больше BREAKER_COOLDOWN_MAX).
+    Неудачей считаются сетевые ошибки, таймауты, 429/5xx и ответы
+    медленнее BREAKER_SLOW_MS.
+    """
+
+    def __init__(self, config: ParserConfig = cfg, clock: Callable[[], float] = time.time):
+        self.config = config
+        self.path = config.BREAKER_STATE_PATH
+        self.lock_path = f'{self.path}.lock'
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        data = utils.safe_load_json(self.path)
+        return data[0] if data and isinstance(data[0], dict) else {}
+
+    def _update(self, provider: str, change: Callable[[dict], None]) -> dict:
+        with self._lock, file_lock(self.lock_path):
+            data = self._load()
+            state = data.setdefault(provider, {'state': CLOSED, 'failures': 0, 'cooldown': 0})
+            change(state)
+            utils.atomic_write_json(self.path, data, indent=None)
+            return state
+
+    def state(self, provider: str) -> Dict[str, Any]:
+        return self._load().get(provider) or {'state': CLOSED, 'failures': 0, 'cooldown': 0}
+
+    def before_request(self, provider: str) -> None:
+        """Пропускает запрос или бросает CircuitOpenError, пока цепь разомкнута."""
+        state = self.state(provider)
+        if state['state'] == CLOSED:
+            return
+        now = self.clock()
+        if state['state'] == OPEN and now >= state.get('open_until', 0):
+            # Пауза прошла: пробный запрос достаётся одному вызывающему
+            granted = []
+
+            def to_half_open(s: dict) -> None:
+                if s['state'] == OPEN and now >= s.get('open_until', 0):
+                    s['state'] = HALF_OPEN
+                    s['probe_at'] = now
+                    granted.append(True)
+            state = self._update(provider, to_half_open)
+            if granted:
+                return
+        if state['state'] == HALF_OPEN and now - state.get('probe_at', 0) > self.config.REQUEST_TIMEOUT * 2:
+            return  # пробный запрос потерялся (процесс упал) — пробуем снова
+        raise exceptions.CircuitOpenError(provider, _iso(state.get('open_until', now)))
+
+    def record(self, provider: str, ok: bool, request_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Учитывает итог запроса; медленный успешный ответ считается неудачей."""
+        if ok and request_ms is not None and request_ms > self.config.BREAKER_SLOW_MS:
+            ok = False
+        now = self.clock()
+
+        def apply(s: dict) -> None:
+            s['last_ms'] = request_ms
+            if ok:
+                s.update(state=CLOSED, failures=0, cooldown=0)
+                s.pop('open_until', None)
+                return
+            s['failures'] = s.get('failures', 0) + 1
+            if s['state'] == HALF_OPEN or s['failures'] >= self.config.BREAKER_FAILURES:
+                cooldown = s.get('cooldown') or 0
+                cooldown = min(cooldown * 2, self.config.BREAKER_COOLDOWN_MAX) if cooldown else self.config.BREAKER_COOLDOWN
+                s.update(state=OPEN, cooldown=cooldown, open_until=now + cooldown)
+
+        return self._update(provider, apply)
+
+
+class RetryPolicy:
+    """
+    Ограниченные повторы с экспоненциальной паузой и полным разбросом
+    (sleep = random(0, min(cap, base * 2**attempt))).
+
+    Повторяются только быстрые временные сбои: обрыв соединения, 429 и 5xx.
+    Таймаут не повторяется — он уже стоил REQUEST_TIMEOUT секунд.
+    Retry-After у 429/503 учитывается, если укладывается в cap.
+    """
+
+    def __init__(
+        self,
+        config: ParserConfig = cfg,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None
+    ):
+        self.attempts = max(1, config.RETRY_ATTEMPTS)
+        self.base = config.RETRY_BACKOFF
+        self.cap = config.RETRY_BACKOFF_MAX
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt: int, resp: Optional[requests.Response] = None) -> float:
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        if retry_after and retry_after.isdigit() and int(retry_after) <= self.cap:
+            return float(retry_after)
+        return self.rng.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    @staticmethod
+    def retryable(error: Optional[Exception], resp: Optional[requests.Response]) -> bool:
+        if isinstance(error, requests.Timeout):
+            return False
+        if isinstance(error, requests.ConnectionError):
+            return True
+        return resp is not None and resp.status_code in RETRYABLE_STATUS
@@ -0,0 +1,247 @@
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from valutatrade_hub.core import alerts, orders, utils
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.updater import REFRESHED, RatesUpdater, refresh_single_flight
+
+cfg = ParserConfig()
+logger = logging.getLogger('parser')
+
+MONTH_SECONDS = 30 * 24 * 3600
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class TokenBucket:
+    """
+    Бюджет запросов: до capacity токенов, пополнение rate токенов в секунду.
+
+    Время берётся из переданного clock, поэтому в тестах его можно подменить.
+    """
+
+    def __init__(self, capacity: float, rate: float, clock: Callable[[], float], tokens: float = None):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.clock = clock
+        self.tokens = self.capacity if tokens is None else min(float(tokens), self.capacity)
+        self.updated = clock()
+
+    @classmethod
+    def monthly(cls, quota: int, burst: int, clock: Callable[[], float], tokens: float = None) -> 'TokenBucket':
+        """Бюджет под месячную квоту: в среднем quota запросов за 30 дней."""
+        return cls(burst, quota / MONTH_SECONDS, clock, tokens)
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, n: float = 1) -> bool:
+        """Списывает n токенов, если они есть."""
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def refund(self, n: float = 1) -> None:
+        """Возвращает n токенов, списанных под запрос, который не понадобился."""
+        self.tokens = min(self.capacity, self.tokens + n)
+
+    def wait_time(self, n: float = 1) -> float:
+        """Через сколько секунд накопится n токенов."""
+        self._refill()
+        if self.tokens >= n or self.rate <= 0:
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+
+class SourceSchedule:
+    """Расписание одного источника: интервал, разброс, бюджет и итоги запусков."""
+
+    def __init__(self, name: str, interval: float, jitter: float = 0.0, budget: Optional[TokenBucket] = None):
+        self.name = name
+        self.interval = float(interval)
+        self.jitter = float(jitter)
+        self.budget = budget
+        self.next_run: float = 0.0
+        self.last_run: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.throttled = 0
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            'interval': self.interval,
+            'next_run': _iso(self.next_run),
+            'last_run': _iso(self.last_run),
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'runs': self.runs,
+            'throttled': self.throttled,
+            'tokens': round(self.budget.tokens, 3) if self.budget else None,
+        }
+
+
+class RatesScheduler:
+    """
+    Планировщик фоновых обновлений курсов.
+
+    Каждый источник обновляется со своим интервалом и случайным разбросом
+    ±jitter через refresh_single_flight — под той же арендой источника, что
+    и обновления из CLI: если источник прямо сейчас обновляет другой процесс,
+    запуск пропускается (coalesced), а токен бюджета возвращается. Перед запуском списывается
+    токен из бюджета источника; если бюджета нет, запуск переносится на
+    момент, когда токен накопится (и следующий запуск сразу планируется
+    не раньше этого момента). Состояние (следующий и последний запуск,
+    остаток бюджета) пишется в файл статуса после каждого шага; при старте
+    остаток бюджета восстанавливается из него.
+
+    clock/sleep/rng подменяются в тестах.
+    """
+
+    def __init__(
+        self,
+        updater=None,
+        schedule: Optional[Dict[str, dict]] = None,
+        status_path: str = cfg.SCHEDULER_STATUS_PATH,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None
+    ):
+        self.updater = updater or RatesUpdater()
+        self.status_path = Path(status_path) if status_path else None
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+
+        saved = self._load_status()
+        now = clock()
+        self.sources: List[SourceSchedule] = []
+        for name, opts in (schedule or cfg.SCHEDULE).items():
+            budget = None
+            if opts.get('monthly_quota'):
+                tokens = saved.get(name, {}).get('tokens')
+                budget = TokenBucket.monthly(opts['monthly_quota'], opts.get('burst', 1), clock, tokens)
+            source = SourceSchedule(name, opts['interval'], opts.get('jitter', 0.0), budget)
+            source.last_run = saved.get(name, {}).get('last_run_ts')
+            # После перезапуска не дёргаем источник раньше его интервала
+            source.next_run = source.last_run + source.interval if source.last_run else now
+            self.sources.append(source)
+
+    def _load_status(self) -> Dict[str, dict]:
+        if not self.status_path:
+            return {}
+        try:
+            with self.status_path.open('r', encoding='utf-8') as f:
+                return json.load(f).get('sources', {})
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            return {}
+
+    def _next_delay(self, source: SourceSchedule) -> float:
+        spread = source.interval * source.jitter
+        return max(0.0, source.interval + self.rng.uniform(-spread, spread))
+
+    def status(self) -> Dict[str, Any]:
+        """Состояние всех источников (как в файле статуса)."""
+        sources = {}
+        for source in self.sources:
+            sources[source.name] = source.to_status()
+            sources[source.name]['last_run_ts'] = source.last_run
+        return {'updated_at': _iso(self.clock()), 'sources': sources}
+
+    def _write_status(self) -> None:
+        if self.status_path:
+            self.status_path.parent.mkdir(parents=True, exist_ok=True)
+            utils.atomic_write_json(self.status_path, self.status())
+
+    def tick(self) -> List[dict]:
+        """Запускает все источники, чьё время подошло. Возвращает их summary."""
+        results = []
+        for source in self.sources:
+            now = self.clock()
+            if now < source.next_run:
+                continue
+
+            if source.budget and not source.budget.try_acquire():
+                source.throttled += 1
+                source.last_status = 'throttled'
+                source.next_run = now + max(source.budget.wait_time(), 1.0)
+                logger.warning(f'Scheduler: {source.name} out of budget, next run {_iso(source.next_run)}')
+                continue
+
+            try:
+                if refresh_single_flight(wait=0, updater=self.updater, source=source.name) != REFRESHED:
+                    summary = {'total_fetched': 0, 'errors': [], 'coalesced': True}
+                    source.last_status = 'coalesced'
+                    source.last_error = None
+                    if source.budget:
+                        source.budget.refund()
+                else:
+                    summary = self.updater.last_summary or {'total_fetched': 0, 'errors': ['no_data']}
+                    failed = not summary.get('total_fetched')
+                    source.last_status = 'error' if failed else 'ok'
+                    source.last_error = '; '.join(
+                        ': '.join(map(str, e)) if isinstance(e, (tuple, list)) else str(e)
+                        for e in summary.get('errors', [])
+                    ) or None
+            except Exception as e:
+                summary = {'total_fetched': 0, 'errors': [(source.name, str(e))]}
+                source.last_status = 'error'
+                source.last_error = str(e)
+            source.runs += 1
+            source.last_run = now
+            # Не раньше, чем бюджет позволит следующий запрос
+            wait = source.budget.wait_time() if source.budget else 0.0
+            source.next_run = now + max(self._next_delay(source), wait)
+            results.append(summary)
+        self._write_status()
+        return results
+
+    def seconds_until_next(self) -> float:
+        return max(0.0, min(s.next_run for s in self.sources) - self.clock()) if self.sources else 0.0
+
+    def run(self, max_ticks: Optional[int] = None) -> None:
+        """Основной цикл: tick → сон до ближайшего запуска. max_ticks — для тестов."""
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            self.tick()
+            ticks += 1
+            self.sleep(self.seconds_until_next())
+
+
+def read_status(path: str = cfg.SCHEDULER_STATUS_PATH) -> Optional[Dict[str, Any]]:
+    """Читает файл статуса планировщика; None, если он ещё не запускался."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def main() -> None:
+    """Точка входа демона: poetry run scheduler."""
+    # Оповещения и отложенные ордера проверяются сразу после каждого обновления
+    alerts.subscribe()
+    orders.subscribe()
+    scheduler = RatesScheduler()
+    names = ', '.join(f'{s.name} every {s.interval:.0f}s' for s in scheduler.sources)
+    logger.info(f'Scheduler started: {names}')
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logger.info('Scheduler stopped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import json
+import lzma
+import os
+import struct
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple
+from valutatrade_hub.parser_service.columnar import to_epoch
+from valutatrade_hub.parser_service.config import ParserConfig
+
+cfg = ParserConfig()
+
+SEGMENT_SUFFIX = '.seg.xz'
+FORMAT_VERSION = 1
+
+
+def _rate_bits(rate: float) -> int:
+    """IEEE-754 представление float как int64 (дельты соседних курсов малы)."""
+    return struct.unpack('<q', struct.pack('<d', rate))[0]
+
+
+def _bits_rate(bits: int) -> float:
+    return struct.unpack('<d', struct.pack('<q', bits))[0]
+
+
+def _delta(values: List[int]) -> List[int]:
+    return [v - prev for prev, v in zip([0] + values[:-1], values)]
+
+
+def _undelta(deltas: List[int]) -> List[int]:
+    values, acc = [], 0
+    for d in deltas:
+        acc += d
+        values.append(acc)
+    return values
+
+
+def _canonical_ts(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def encode_segment(entries: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Кодирует записи истории в сжатый сегмент.
+
+    По каждой паре время и курс хранятся дельтами (курс — дельтами битового
+    представления float64, без потери точности), затем всё сжимается lzma.
+    Строки времени и id, не совпадающие с каноническим видом, сохраняются
+    как исключения, поэтому декодирование восстанавливает записи один в один.
+    """
+    by_pair = defaultdict(list)
+    for entry in entries:
+        by_pair[f"{entry['from_currency']}_{entry['to_currency']}"].append(entry)
+
+    pairs = {}
+    for pair, rows in by_pair.items():
+        rows.sort(key=lambda e: to_epoch(e['timestamp']))
+        epochs = [to_epoch(e['timestamp']) for e in rows]
+        column = {
+            't': _delta(epochs),
+            'r': _delta([_rate_bits(float(e['rate'])) for e in rows]),
+            'src': [e.get('source') for e in rows],
+            'meta': [e.get('meta') or {} for e in rows],
+            'ts_raw': {},
+            'id_raw': {},
+        }
+        for i, (epoch, e) in enumerate(zip(epochs, rows)):
+            if e['timestamp'] != _canonical_ts(epoch):
+                column['ts_raw'][str(i)] = e['timestamp']
+            if e.get('id') != f"{pair}_{e['timestamp']}":
+                column['id_raw'][str(i)] = e.get('id')
+        pairs[pair] = column
+
+    payload = json.dumps({'v': FORMAT_VERSION, 'pairs': pairs}, ensure_ascii=False, separators=(',', ':'))
+    return lzma.compress(payload.encode('utf-8'))
+
+
+def decode_segment(blob: bytes) -> List[Dict[str, Any]]:
+    """Восстанавливает записи из сегмента, упорядоченные по времени."""
+    payload = json.loads(lzma.decompress(blob))
+    decoded = []
+    for pair, column in payload['pairs'].items():
+        from_code, to_code = pair.split('_')
+        epochs = _undelta(column['t'])
+        bits = _undelta(column['r'])
+        for i, (epoch, rate_bits) in enumerate(zip(epochs, bits)):
+            timestamp = column['ts_raw'].get(str(i)) or _canonical_ts(epoch)
+            decoded.append((epoch, {
+                'id': column['id_raw'].get(str(i)) or f'{pair}_{timestamp}',
+                'from_currency': from_code,
+                'to_currency': to_code,
+                'rate': _bits_rate(rate_bits),
+                'timestamp': timestamp,
+                'source': column['src'][i],
+                'meta': column['meta'][i]
+            }))
+    decoded.sort(key=lambda item: item[0])
+    return [entry for _, entry in decoded]
+
+
+class Segment(NamedTuple):
+    start: str
+    end: str
+    path: Path
+
+    @property
+    def size(self) -> int:
+        return self.path.stat().st_size
+
+
+class SegmentStore:
+    """
+    Запечатанные сегменты истории: <start>_<end>.seg.xz, где start/end — дни (UTC).
+
+    Сегменты не изменяются после записи; compact() сливает соседние
+    маленькие сегменты в один больший.
+    """
+
+    def __init__(self, directory: str = cfg.HISTORY_SEGMENTS_DIR):
+        self.directory = Path(directory)
+
+    def _all_segments(self) -> List[Segment]:
+        if not self.directory.exists():
+            return []
+        found = []
+        for path in self.directory.glob(f'*{SEGMENT_SUFFIX}'):
+            start, _, end = path.name[:-len(SEGMENT_SUFFIX)].partition('_')
+            found.append(Segment(start, end, path))
+        found.sort(key=lambda s: (s.start, s.end))
+        return found
+
+    def segments(self) -> List[Segment]:
+        """
+        Сегменты по возрастанию времени. Сегменты, поглощённые более широким
+        (остаток прерванного compact), пропускаются.
+        """
+        found = self._all_segments()
+        return [
+            s for s in found
+            if not any(o is not s and o.start <= s.start and s.end <= o.end for o in found)
+        ]
+
+    def _path(self, start: str, end: str) -> Path:
+        return self.directory / f'{start}_{end}{SEGMENT_SUFFIX}'
+
+    def _write(self, start: str, end: str, entries: Iterable[Dict[str, Any]]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(start, end)
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        tmp.write_bytes(encode_segment(entries))
+        os.replace(tmp, path)
+        return path
+
+    @staticmethod
+    def read(segment: Segment) -> List[Dict[str, Any]]:
+        return decode_segment(segment.path.read_bytes())
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        for segment in self.segments():
+            yield from self.read(segment)
+
+    def seal(self, entries: Iterable[Dict[str, Any]]) -> List[Path]:
+        """
+        Запечатывает записи активного сегмента в дневные сегменты.
+
+        Если сегмент за этот день уже есть (повтор после сбоя), записи
+        объединяются с ним по id.
+        """
+        by_day = defaultdict(dict)
+        for entry in entries:
+            by_day[entry['timestamp'][:10]][entry['id']] = entry
+
+        existing = self.segments()
+        written = []
+        for day, rows in sorted(by_day.items()):
+            for segment in existing:
+                if segment.start <= day <= segment.end:
+                    for old in self.read(segment):
+                        rows.setdefault(old['id'], old)
+                    day_start, day_end = segment.start, segment.end
+                    break
+            else:
+                day_start = day_end = day
+            written.append(self._write(day_start, day_end, rows.values()))
+        return written
+
+    def compact(self, small_bytes: int = 64 * 1024, max_days: int = 31) -> int:
+        """
+        Сливает подряд идущие сегменты меньше small_bytes в сегменты
+        длиной не более max_days дней. Возвращает число слитых сегментов.
+        """
+        visible = self.segments()
+        for segment in self._all_segments():
+            if segment not in visible:
+                segment.path.unlink()
+
+        merged = 0
+        run: List[Segment] = []
+
+        def flush() -> None:
+            nonlocal merged
+            if len(run) > 1:
+                rows = [e for segment in run for e in self.read(segment)]
+                self._write(run[0].start, run[-1].end, rows)
+                for segment in run:
+                    segment.path.unlink()
+                merged += len(run)
+            run.clear()
+
+        for segment in visible:
+            if segment.size >= small_bytes:
+                flush()
+                continue
+            span = (date.fromisoformat(segment.end) - date.fromisoformat(run[0].start)).days if run else 0
+            if run and span >= max_days:
+                flush()
+            run.append(segment)
+        flush()
+        return merged
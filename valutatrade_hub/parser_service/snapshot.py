@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from functools import cached_property
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.crossrates import CrossRates
+
+cfg = ParserConfig()
+
+
+class RatesSnapshot:
+    """
+    Неизменяемый снимок rates.json.
+
+    Пары и их поля доступны только на чтение (MappingProxyType),
+    поэтому один снимок безопасно делить между всеми читателями.
+    """
+
+    def __init__(
+        self,
+        pairs: Dict[str, Dict[str, Any]],
+        last_refresh: Optional[str],
+        sources: Optional[Dict[str, str]] = None
+    ):
+        self.pairs: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+            key: MappingProxyType(dict(info)) for key, info in pairs.items()
+        })
+        self.last_refresh = last_refresh
+        # Время последнего обновления по каждому источнику
+        self.sources: Mapping[str, str] = MappingProxyType(dict(sources or {}))
+
+    def get(self, from_code: str, to_code: str) -> Optional[Mapping[str, Any]]:
+        """Запись прямой пары FROM_TO или None."""
+        return self.pairs.get(f'{from_code.upper()}_{to_code.upper()}')
+
+    @cached_property
+    def cross(self) -> CrossRates:
+        """Матрица кросс-курсов; строится один раз на снимок."""
+        return CrossRates(self.pairs)
+
+    def lookup(self, from_code: str, to_code: str) -> Optional[Dict[str, Any]]:
+        """
+        Курс любой валюты в любую: {'rate', 'updated_at'} или None.
+
+        Прямая и обратная пары, а также кросс-курс через общие валюты.
+        """
+        found = self.cross.lookup(from_code, to_code)
+        if found is None or from_code.upper() == to_code.upper():
+            return None
+        return {'rate': found['rate'], 'updated_at': found['updated_at']}
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Снимок в формате rates.json: {'pairs': ..., 'last_refresh': ..., 'sources': ...}."""
+        return {'pairs': self.pairs, 'last_refresh': self.last_refresh, 'sources': self.sources}
+
+
+class RatesSnapshotProvider:
+    """
+    Источник снимков одного файла курсов.
+
+    Файл разбирается один раз; повторный разбор — только если изменились
+    mtime/inode/размер файла или после явного invalidate() (RatesCache.write).
+    """
+
+    def __init__(self, path: str = cfg.RATES_FILE_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[RatesSnapshot] = None
+        self._signature = None
+
+    def _stat_signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self) -> RatesSnapshot:
+        try:
+            with self.path.open('r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        return RatesSnapshot(data.get('pairs') or {}, data.get('last_refresh'), data.get('sources'))
+
+    def get(self) -> RatesSnapshot:
+        """Текущий снимок; файл перечитывается только при изменении."""
+        signature = self._stat_signature()
+        snapshot = self._snapshot
+        if snapshot is not None and signature == self._signature:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or signature != self._signature:
+                self._snapshot = self._load()
+                self._signature = signature
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        """Сбрасывает снимок: следующий get() перечитает файл."""
+        with self._lock:
+            self._snapshot = None
+            self._signature = None
+
+
+_providers: Dict[str, RatesSnapshotProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(path: str = cfg.RATES_FILE_PATH) -> RatesSnapshotProvider:
+    """Общий для процесса провайдер снимков файла path."""
+    key = os.path.abspath(path)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = RatesSnapshotProvider(path)
+        return provider
+
+
+def get_rates_snapshot(path: str = cfg.RATES_FILE_PATH) -> RatesSnapshot:
+    """Текущий снимок курсов файла path (по умолчанию rates.json)."""
+    return get_provider(path).get()
+
+
+def invalidate(path: str = cfg.RATES_FILE_PATH) -> None:
+    """Сбрасывает снимок файла path после записи в него."""
+    get_provider(path).invalidate()
@@ -0,0 +1,227 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from valutatrade_hub.core import utils  # noqa: F401 — core раньше parser_service, иначе цикл импорта
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.updater import logger
+from valutatrade_hub.parser_service.replay import RandomWalk, start_prices
+
+cfg = ParserConfig()
+
+
+class StandinPrices:
+    """
+    Цены стенда: случайное блуждание, сдвигающееся раз в tick секунд.
+
+    Внутри одного тика ответы одинаковы и получают один ETag, поэтому
+    условные запросы клиентов получают 304, как у настоящих провайдеров.
+    """
+
+    def __init__(self, walk: RandomWalk, tick: float = 1.0, clock=time.monotonic):
+        self.walk = walk
+        self.tick = tick
+        self.clock = clock
+        self.started = clock()
+        self.version = 0
+        self.prices = dict(walk.prices)
+        self._lock = threading.Lock()
+
+    def current(self) -> Tuple[int, Dict[str, float]]:
+        """(номер тика, {пара к USD: цена})."""
+        with self._lock:
+            version = int((self.clock() - self.started) / self.tick) if self.tick > 0 else self.version + 1
+            if version > self.version:
+                # Простой тиков не проигрывается целиком: достаточно одного шага
+                self.prices = self.walk.step()
+                self.version = version
+            return self.version, self.prices
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+    Эндпоинты провайдеров:
+     - GET .../simple/price?ids=bitcoin,...&vs_currencies=usd — как CoinGecko;
+     - GET .../<key>/latest/<BASE> — как ExchangeRate-API v6.
+    """
+
+    server: 'StandinServer'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            logger.info('standin: ' + format % args)
+
+    def _send(self, status: int, body: Any, version: Optional[int] = None) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if version is not None:
+            self.send_header('ETag', f'"{version}"')
+            if self.server.max_age:
+                self.send_header('Cache-Control', f'max-age={self.server.max_age}')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.count()
+        if server.latency_ms or server.jitter_ms:
+            time.sleep((server.latency_ms + server.rng.uniform(0, server.jitter_ms)) / 1000)
+        if server.error_rate and server.rng.random() < server.error_rate:
+            self._send(503, {'error': 'simulated outage'})
+            return
+
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        version, prices = server.prices.current()
+        if parts[-2:] == ['simple', 'price']:
+            body = self._coingecko(parse_qs(url.query), prices)
+        elif len(parts) >= 3 and parts[-2] == 'latest':
+            body = self._exchangerate(parts[-1].upper(), prices, version)
+        else:
+            self._send(404, {'error': f'unknown endpoint {url.path}'})
+            return
+
+        if self.headers.get('If-None-Match') == f'"{version}"':
+            self.send_response(304)
+            self.send_header('ETag', f'"{version}"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(200, body, version)
+
+    def _coingecko(self, query: Dict[str, list], prices: Dict[str, float]) -> Dict[str, dict]:
+        ids = ','.join(query.get('ids', [])).split(',')
+        vs = [v.upper() for v in ','.join(query.get('vs_currencies', [])).split(',') if v]
+        symbols = {cg_id: symbol for symbol, cg_id in self.server.config.CRYPTO_ID_MAP.items()}
+        body = {}
+        for cg_id in ids:
+            usd = prices.get(f'{symbols.get(cg_id)}_USD')
+            if usd is None:
+                continue
+            body[cg_id] = {
+                target.lower(): usd / _usd_price(prices, target)
+                for target in vs if _usd_price(prices, target)
+            }
+        return body
+
+    def _exchangerate(self, base: str, prices: Dict[str, float], version: int) -> Dict[str, Any]:
+        base_usd = _usd_price(prices, base)
+        if not base_usd:
+            return {'result': 'error', 'error-type': 'unsupported-code'}
+        now = int(time.time())
+        body = {
+            'result': 'success',
+            'base_code': base,
+            'time_last_update_unix': now,
+            'conversion_rates': {
+                code: base_usd / usd
+                for code, usd in ((c, _usd_price(prices, c)) for c in self.server.fiat)
+                if usd
+            }
+        }
+        if self.server.max_age:
+            body['time_next_update_unix'] = now + self.server.max_age
+        return body
+
+
+def _usd_price(prices: Dict[str, float], code: str) -> Optional[float]:
+    """Цена валюты code в USD (USD — 1.0) или None."""
+    return 1.0 if code == 'USD' else prices.get(f'{code}_USD')
+
+
+class StandinServer(ThreadingHTTPServer):
+    """HTTP-стенд провайдеров курсов с настраиваемой задержкой и долей ошибок."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        prices: StandinPrices,
+        config: ParserConfig = cfg,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        max_age: int = 0,
+        seed: Optional[int] = None,
+        verbose: bool = False
+    ):
+        super().__init__(address, StandinHandler)
+        self.prices = prices
+        self.config = config
+        self.fiat = ('USD',) + tuple(config.FIAT_CURRENCIES)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.max_age = max_age
+        self.rng = random.Random(seed)
+        self.verbose = verbose
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    def count(self) -> None:
+        with self._count_lock:
+            self.requests += 1
+
+    def urls(self) -> Dict[str, str]:
+        """Значения COINGECKO_URL и EXCHANGERATE_API_URL для этого стенда."""
+        host, port = self.server_address[:2]
+        return {
+            'COINGECKO_URL': f'http://{host}:{port}/api/v3/simple/price',
+            'EXCHANGERATE_API_URL': f'http://{host}:{port}/v6'
+        }
+
+
+def make_server(
+    host: str = '127.0.0.1',
+    port: int = 0,
+    config: ParserConfig = cfg,
+    tick: float = 1.0,
+    volatility: float = 0.001,
+    seed: Optional[int] = None,
+    **options: Any
+) -> StandinServer:
+    """Создаёт стенд (port=0 — свободный порт); запуск — serve_forever()."""
+    prices = StandinPrices(RandomWalk(start_prices(config), volatility, seed), tick)
+    return StandinServer((host, port), prices, config, seed=seed, **options)
+
+
+def main() -> None:
+    """Точка входа: poetry run standin --port 8099 --latency-ms 200 --error-rate 0.05."""
+    parser = argparse.ArgumentParser(description='Local stand-in for CoinGecko and ExchangeRate-API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added delay per request')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='random extra delay, 0..N ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--max-age', type=int, default=0, help='Cache-Control max-age / time_next_update (s)')
+    parser.add_argument('--tick', type=float, default=1.0, help='seconds between price moves')
+    parser.add_argument('--volatility', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port, tick=args.tick, volatility=args.volatility, seed=args.seed,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        max_age=args.max_age, verbose=args.verbose
+    )
+    for name, url in server.urls().items():
+        logger.info(f'{name}={url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f'Stand-in stopped after {server.requests} requests')
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,30 @@
 import json
 import os
+from abc import ABC, abstractmethod
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Dict, Any
-from valutatrade_hub.core import exceptions, utils, constants
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from valutatrade_hub.core import constants, exceptions, utils
+from valutatrade_hub.infra.locking import file_lock
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.snapshot import RatesSnapshot, get_rates_snapshot, invalidate
+from valutatrade_hub.parser_service.segments import SegmentStore
 
 cfg = ParserConfig()
 
 
 def _now_iso() -> str:
     """Возвращает текущее время в UTC (ISO + Z)."""
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat() + 'Z'
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
 
 
-def _atomic_write(path: Path, data: Any) -> None:
-    """Атомарно записывает JSON в файл через .tmp."""
-    tmp = path.with_suffix('.tmp')
-    with tmp.open('w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
+class HistoryRepository(ABC):
+    """
+    Абстрактное хранилище истории курсов.
 
-
-class ExchangeRatesRepo:
-    """Репозиторий истории курсов (exchange_rates.json → список записей)."""
-
-    def __init__(self, path: str = cfg.HISTORY_FILE_PATH):
-        """Инициализирует путь и создаёт пустой файл при отсутствии."""
-        self.path = Path(path)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.path.exists():
-            self.path.write_text('[]', encoding='utf-8')
+    Наследники реализуют пакетную запись и чтение; проверка полей и
+    формат записи общие.
+    """
 
     @staticmethod
     def _validate_code(code: str) -> None:
@@ -38,18 +32,16 @@ class ExchangeRatesRepo:
         if not (isinstance(code, str) and code.isalpha() and 2 <= len(code) <= 5):
             raise exceptions.ApiRequestError(f'Invalid currency code: {code}')
 
-    def save_measurement(
+    def _build_entry(
         self,
         from_currency: str,
         to_currency: str,
         rate: float,
         source: str,
-        meta: Dict[str, Any]
+        meta: Dict[str, Any],
+        timestamp: str
     ) -> Dict[str, Any]:
-        """
-        Сохраняет одну запись курса в историю.
-        Возвращает созданную запись.
-        """
+        """Проверяет поля и собирает запись истории."""
         from_code = from_currency.upper()
         to_code = to_currency.upper()
 
@@ -59,11 +51,8 @@ class ExchangeRatesRepo:
         if not isinstance(rate, (int, float)):
             raise exceptions.ApiRequestError('Rate must be numeric')
 
-        timestamp = _now_iso()
-        uid = f'{from_code}_{to_code}_{timestamp}'
-
-        entry = {
-            'id': uid,
+        return {
+            'id': f'{from_code}_{to_code}_{timestamp}',
             'from_currency': from_code,
             'to_currency': to_code,
             'rate': float(rate),
@@ -72,22 +61,312 @@ class ExchangeRatesRepo:
             'meta': meta or {}
         }
 
+    def _build_entries(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        timestamp: str
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """Собирает записи пачки; некорректные попадают в список ошибок."""
+        built, errors = [], []
+        for item in entries:
+            key = f"{item.get('from_currency')}_{item.get('to_currency')}"
+            try:
+                built.append(self._build_entry(
+                    item['from_currency'],
+                    item['to_currency'],
+                    item['rate'],
+                    item.get('source'),
+                    item.get('meta'),
+                    timestamp
+                ))
+            except (exceptions.ApiRequestError, KeyError, AttributeError) as e:
+                errors.append((key, str(e)))
+        return built, errors
+
+    def save_measurement(
+        self,
+        from_currency: str,
+        to_currency: str,
+        rate: float,
+        source: str,
+        meta: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Сохраняет одну запись курса в историю.
+        Возвращает созданную запись.
+        """
+        saved, errors = self.save_measurements([{
+            'from_currency': from_currency,
+            'to_currency': to_currency,
+            'rate': rate,
+            'source': source,
+            'meta': meta
+        }])
+        if errors:
+            raise exceptions.ApiRequestError(errors[0][1])
+        return saved[0]
+
+    @abstractmethod
+    def save_measurements(
+        self,
+        entries: Iterable[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """
+        Сохраняет пачку измерений одной записью.
+
+        entries — словари с ключами from_currency, to_currency, rate, source, meta.
+        Некорректные измерения пропускаются и попадают в список ошибок.
+
+        Returns:
+            (saved, errors): созданные записи и пары (ключ, причина).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        """Итерирует записи истории в порядке добавления."""
+        raise NotImplementedError
+
+    def read_history(self) -> List[Dict[str, Any]]:
+        """Возвращает всю историю списком — в том же виде, что и exchange_rates.json."""
+        return list(self.iter_history())
+
+
+class ExchangeRatesRepo(HistoryRepository):
+    """
+    Репозиторий истории курсов: активный сегмент exchange_rates.jsonl
+    (журнал JSON Lines) и запечатанные сжатые сегменты по дням.
+
+    Каждое измерение дописывается в конец активного сегмента одной строкой.
+    Когда наступает новый день (UTC), активный сегмент запечатывается в
+    дневной сегмент SegmentStore и начинается заново — переписывается
+    только он. Для дедупликации рядом хранится индекс (*.idx.json):
+    последний id по каждой паре и длина журнала, до которой индекс актуален.
+    Старый exchange_rates.json (JSON-массив) однократно переносится в журнал.
+    """
+
+    def __init__(
+        self,
+        path: str = cfg.HISTORY_LOG_PATH,
+        legacy_path: str | None = cfg.HISTORY_FILE_PATH,
+        segments_dir: str | None = None
+    ):
+        """Инициализирует пути, переносит старую историю и загружает индекс."""
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.index_path = self.path.with_suffix('.idx.json')
+        self.lock_path = self.path.with_name(f'{self.path.name}.lock')
+        self.segments = SegmentStore(segments_dir or self.path.with_name(f'{self.path.stem}_segments'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Перенос и починка индекса — под блокировкой: процессы могут стартовать одновременно
+        with file_lock(self.lock_path):
+            if not self.path.exists():
+                self._migrate_legacy()
+            self._last_ids, self._offset = self._load_index()
+
+    @staticmethod
+    def _pair_of(entry: Dict[str, Any]) -> str:
+        return f"{entry.get('from_currency')}_{entry.get('to_currency')}"
+
+    def _migrate_legacy(self) -> None:
+        """Переносит записи из exchange_rates.json в новый журнал."""
+        history = []
+        if self.legacy_path and self.legacy_path.exists():
+            history = utils.safe_load_json(str(self.legacy_path))
+        self._replace_active(history)
+
+    def _replace_active(self, entries: Iterable[Dict[str, Any]]) -> None:
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with tmp.open('w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp, self.path)
+
+    def _scan(self, offset: int, last_ids: Dict[str, str]) -> int:
+        """Дочитывает журнал с позиции offset, обновляя last_ids. Возвращает новую длину."""
+        with self.path.open('rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                offset += len(raw)
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    continue
+                last_ids[self._pair_of(entry)] = entry.get('id')
+        return offset
+
+    def _load_index(self) -> tuple[Dict[str, str], int]:
+        """Загружает индекс и догоняет им хвост журнала, если тот длиннее."""
         try:
-            history = utils.safe_load_json(constants.EXCHANGE_RATES_PATH)
-        except Exception as e:
-            raise exceptions.ApiRequestError(f'Failed to read history file: {e}')
+            with self.index_path.open('r', encoding='utf-8') as f:
+                data = json.load(f)
+            last_ids, offset = dict(data['last_ids']), int(data['offset'])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            last_ids, offset = {}, 0
+
+        if offset > self.path.stat().st_size:
+            offset = 0
+
+        new_offset = self._scan(offset, last_ids)
+        if new_offset != offset or not self.index_path.exists():
+            self._save_index(last_ids, new_offset)
+        return last_ids, new_offset
+
+    def _save_index(self, last_ids: Dict[str, str], offset: int) -> None:
+        utils.atomic_write_json(self.index_path, {'offset': offset, 'last_ids': last_ids}, indent=2)
+
+    def _iter_active(self) -> Iterator[Dict[str, Any]]:
+        """Построчно читает активный сегмент, пропуская повреждённые строки."""
+        with self.path.open('r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _active_day(self) -> str | None:
+        """День (UTC) первой записи активного сегмента."""
+        for entry in self._iter_active():
+            return str(entry.get('timestamp', ''))[:10] or None
+        return None
+
+    def _seal_active(self) -> None:
+        """Запечатывает активный сегмент в дневные сегменты и очищает его."""
+        self.segments.seal(self._iter_active())
+        self._replace_active([])
+        self._offset = 0
+        self._save_index(self._last_ids, self._offset)
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        """Читает запечатанные сегменты по порядку, затем активный."""
+        yield from self.segments.iter_entries()
+        yield from self._iter_active()
+
+    def compact(self, small_bytes: int = 64 * 1024, max_days: int = 31) -> int:
+        """Сливает мелкие запечатанные сегменты. Возвращает число слитых сегментов."""
+        with file_lock(self.lock_path):
+            return self.segments.compact(small_bytes, max_days)
+
+    def save_measurements(
+        self,
+        entries: Iterable[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """Дописывает пачку в журнал одним write + fsync; индекс сохраняется один раз."""
+        timestamp = _now_iso()
+        saved, errors = self._build_entries(entries, timestamp)
+
+        with file_lock(self.lock_path):
+            size = self.path.stat().st_size
+            if size < self._offset:
+                # Активный сегмент запечатан другим процессом
+                self._offset = 0
+            if size > self._offset:
+                self._offset = self._scan(self._offset, self._last_ids)
+
+            active_day = self._active_day() if self._offset else None
+            if active_day and active_day != timestamp[:10]:
+                try:
+                    self._seal_active()
+                except Exception as e:
+                    raise exceptions.ApiRequestError(f'Failed to seal history segment: {e}')
 
-        if any(item.get('id') == uid for item in history):
-            return entry  
+            lines = []
+            last_ids = dict(self._last_ids)
+            for entry in saved:
+                pair = self._pair_of(entry)
+                if last_ids.get(pair) == entry['id']:
+                    continue
+                last_ids[pair] = entry['id']
+                lines.append(json.dumps(entry, ensure_ascii=False) + '\n')
 
-        history.append(entry)
+            if not lines:
+                return saved, errors
 
+            try:
+                with self.path.open('ab') as f:
+                    f.write(''.join(lines).encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._offset = f.tell()
+                self._last_ids = last_ids
+                self._save_index(self._last_ids, self._offset)
+            except Exception as e:
+                raise exceptions.ApiRequestError(f'Failed to write history file: {e}')
+
+        return saved, errors
+
+
+class SqliteHistoryRepo(HistoryRepository):
+    """
+    История курсов в таблице rates_history (SQLite, индекс по паре и времени).
+
+    Дубликаты отсекаются первичным ключом id. При первом открытии
+    переносит записи из JSON-журнала.
+    """
+
+    def __init__(self, db, config: ParserConfig = cfg):
+        """db — sqlite_storage.SqliteDatabase."""
+        self.db = db
+        if not db.get_flag('history_migrated'):
+            legacy = ExchangeRatesRepo(config.HISTORY_LOG_PATH, config.HISTORY_FILE_PATH, config.HISTORY_SEGMENTS_DIR)
+            with db.transaction() as conn:
+                self._insert(conn, legacy.iter_history())
+                db.set_flag(conn, 'history_migrated', '1')
+
+    @staticmethod
+    def _insert(conn, entries: Iterable[Dict[str, Any]]) -> None:
+        conn.executemany(
+            'INSERT OR IGNORE INTO rates_history '
+            '(id, pair, from_currency, to_currency, rate, timestamp, source, meta) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    e['id'],
+                    f"{e['from_currency']}_{e['to_currency']}",
+                    e['from_currency'],
+                    e['to_currency'],
+                    e['rate'],
+                    e['timestamp'],
+                    e.get('source'),
+                    json.dumps(e.get('meta') or {}, ensure_ascii=False)
+                )
+                for e in entries
+            ]
+        )
+
+    def save_measurements(
+        self,
+        entries: Iterable[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """Сохраняет пачку одной транзакцией."""
+        saved, errors = self._build_entries(entries, _now_iso())
         try:
-            _atomic_write(self.path, history)
+            with self.db.transaction() as conn:
+                self._insert(conn, saved)
         except Exception as e:
-            raise exceptions.ApiRequestError(f'Failed to write history file: {e}')
+            raise exceptions.ApiRequestError(f'Failed to write history table: {e}')
+        return saved, errors
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                'SELECT id, from_currency, to_currency, rate, timestamp, source, meta '
+                'FROM rates_history ORDER BY rowid'
+            ).fetchall()
+        for row in rows:
+            entry = dict(row)
+            entry['meta'] = json.loads(entry['meta'] or '{}')
+            yield entry
+
 
-        return entry
+def get_history_repo(config: ParserConfig = cfg) -> HistoryRepository:
+    """Возвращает хранилище истории для бэкенда из STORAGE_BACKEND."""
+    if (constants.STORAGE_BACKEND or 'json').lower() == 'sqlite':
+        from valutatrade_hub.infra import sqlite_storage
+        return SqliteHistoryRepo(sqlite_storage.get_database(), config)
+    return ExchangeRatesRepo(config.HISTORY_LOG_PATH, config.HISTORY_FILE_PATH, config.HISTORY_SEGMENTS_DIR)
 
 
 class RatesCache:
@@ -96,28 +375,90 @@ class RatesCache:
     def __init__(self, path: str = cfg.RATES_FILE_PATH):
         """Инициализирует путь и создаёт начальный файл при отсутствии."""
         self.path = Path(path)
+        self.lock_path = f'{path}.lock'
+        # Сериализованные строки пар: {пара: (запись, строка JSON)}
+        self._fragments: Dict[str, Tuple[Dict[str, Any], str]] = {}
         self.path.parent.mkdir(parents=True, exist_ok=True)
         if not self.path.exists():
             initial = {'pairs': {}, 'last_refresh': None}
             self.path.write_text(json.dumps(initial, ensure_ascii=False, indent=2), encoding='utf-8')
 
+    def snapshot(self) -> RatesSnapshot:
+        """Неизменяемый снимок кэша; файл разбирается заново только при изменении."""
+        return get_rates_snapshot(str(self.path))
+
     def read(self) -> Dict[str, Any]:
-        """Читает кэш. Возвращает пустой при ошибке JSON."""
-        try:
-            with self.path.open('r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return {'pairs': {}, 'last_refresh': None}
+        """Читает кэш (пары только на чтение). Пустой при ошибке JSON."""
+        return self.snapshot().as_dict()
 
-    def write(self, pairs: Dict[str, Dict[str, Any]], last_refresh: str) -> None:
-        """Записывает в rates.json с правильной структурой."""
+    def write(self, pairs: Dict[str, Dict[str, Any]], last_refresh: str) -> Dict[str, Optional[float]]:
+        """
+        Сливает пары в rates.json и возвращает словарь изменённых пар
+        с прежним курсом: {пара: старый курс или None для новой пары}.
+        Изменённой считается пара с другим rate или source; новое updated_at
+        при том же курсе записывается, но изменением не считается.
+
+        Пары, которых нет в pairs, остаются как есть — обновление одного
+        источника не стирает курсы другого. У каждой пары свои updated_at
+        и source; в sources хранится last_refresh каждого источника.
+        Запись идёт под файловой блокировкой, чтобы параллельные частичные
+        обновления из разных процессов не теряли пары друг друга.
+        """
         if not pairs:
             raise ValueError("pairs cannot be empty")
         if not last_refresh:
             raise ValueError("last_refresh required")
 
-        payload = {"pairs": pairs, "last_refresh": last_refresh}
         try:
-            _atomic_write(self.path, payload)
-        except Exception as e:
-            raise exceptions.ApiRequestError(f'Cache write error: {e}')
\ No newline at end of file
+            with file_lock(self.lock_path):
+                invalidate(str(self.path))
+                current = self.snapshot()
+                merged = {key: dict(info) for key, info in current.pairs.items()}
+                sources = dict(current.sources)
+                changed: Dict[str, Optional[float]] = {}
+                for key, info in pairs.items():
+                    entry = {
+                        'rate': float(info['rate']),
+                        'updated_at': info.get('updated_at') or last_refresh,
+                        'source': info.get('source') or 'unknown'
+                    }
+                    previous = merged.get(key)
+                    if previous is None:
+                        changed[key] = None
+                    elif (previous.get('rate'), previous.get('source')) != (entry['rate'], entry['source']):
+                        changed[key] = previous.get('rate')
+                    merged[key] = entry
+                    sources[entry['source']] = max(sources.get(entry['source']) or '', entry['updated_at'])
+                newest = max(filter(None, (current.last_refresh, last_refresh)))
+                self._write_merged(merged, newest, sources)
+                return changed
+        except (KeyError, TypeError, ValueError) as e:
+            raise exceptions.ApiRequestError(f'Cache write error: bad pair data ({e})')
+        except OSError as e:
+            raise exceptions.ApiRequestError(f'Cache write error: {e}')
+        finally:
+            invalidate(str(self.path))
+
+    def _write_merged(self, pairs: Dict[str, Dict[str, Any]], last_refresh: str, sources: Dict[str, str]) -> None:
+        """
+        Атомарная запись rates.json: одна пара — одна строка.
+
+        Строки неизменившихся пар берутся из памяти, заново сериализуются
+        только изменённые.
+        """
+        lines = []
+        for key in sorted(pairs):
+            info = pairs[key]
+            cached = self._fragments.get(key)
+            if cached is None or cached[0] != info:
+                cached = (info, f'    {json.dumps(key)}: {json.dumps(info, ensure_ascii=False)}')
+                self._fragments[key] = cached
+            lines.append(cached[1])
+        text = (
+            '{\n  "pairs": {\n' + ',\n'.join(lines) + '\n  },\n'
+            f'  "last_refresh": {json.dumps(last_refresh)},\n'
+            f'  "sources": {json.dumps(sources, ensure_ascii=False, sort_keys=True)}\n}}\n'
+        )
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, self.path)
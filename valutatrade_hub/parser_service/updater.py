@@ -1,9 +1,15 @@
 import logging
+import queue
+import threading
 from datetime import datetime, timezone
-from typing import List
+from time import perf_counter
+from typing import Callable, List, Optional
+from valutatrade_hub.infra import locking
 from valutatrade_hub.parser_service.api_clients import BaseApiClient, CoinGeckoClient, ExchangeRateApiClient
-from valutatrade_hub.parser_service.storage import ExchangeRatesRepo, RatesCache
+from valutatrade_hub.parser_service.storage import HistoryRepository, RatesCache, get_history_repo
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.columnar import ColumnarRatesStore
+from valutatrade_hub.parser_service.events import EventBus, get_bus, rate_change
 
 cfg = ParserConfig()
 logger = logging.getLogger('parser')
@@ -21,102 +27,303 @@ class RatesUpdater:
     def __init__(
         self,
         clients: List[BaseApiClient] = None,
-        history_repo: ExchangeRatesRepo = None,
+        history_repo: HistoryRepository = None,
         cache: RatesCache = None,
-        config: ParserConfig = cfg
+        config: ParserConfig = cfg,
+        columns: ColumnarRatesStore = None,
+        bus: EventBus = None
     ):
         """Инициализирует клиенты, репозитории и конфиг."""
         self.config = config
-        self.clients = clients or [CoinGeckoClient(config), ExchangeRateApiClient(config)]
-        self.history = history_repo or ExchangeRatesRepo(config.HISTORY_FILE_PATH)
+        self.clients = clients or self._default_clients(config)
+        self.history = history_repo or get_history_repo(config)
         self.cache = cache or RatesCache(config.RATES_FILE_PATH)
+        self.columns = columns or ColumnarRatesStore(config.HISTORY_COLUMNS_DIR)
+        self.bus = bus or get_bus(config.EVENTS_PATH)
+        # summary последнего run_update — для вызовов через refresh_single_flight
+        self.last_summary: Optional[dict] = None
+        if not self.columns.exists():
+            self.columns.rebuild(self.history.iter_history())
 
     @staticmethod
-    def _utc_iso_now() -> str:
-        return datetime.now(timezone.utc).replace(microsecond=0).isoformat() + 'Z'
+    def _default_clients(config: ParserConfig) -> List[BaseApiClient]:
+        """Реальные API или, при REPLAY_MODE, офлайн-клиент ReplayApiClient."""
+        if config.REPLAY_MODE:
+            from valutatrade_hub.parser_service.replay import ReplayApiClient
+            return [ReplayApiClient(config, mode=config.REPLAY_MODE)]
+        return [CoinGeckoClient(config), ExchangeRateApiClient(config)]
 
-    def run_update(self, source: str = None) -> dict:
-        """
-        Запускает обновление курсов.
+    @staticmethod
+    def _utc_iso_now() -> str:
+        return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        Args:
-            source: 'coingecko' или 'exchangerate' — обновить только один источник.
+    def _fetch(self, client: BaseApiClient) -> tuple:
+        """Запрос к одному клиенту (в отдельном потоке) с замером времени."""
+        started = perf_counter()
+        try:
+            rates, meta = client.fetch_rates()
+            return rates, meta, None, perf_counter() - started
+        except Exception as e:
+            return {}, {}, e, perf_counter() - started
 
-        Returns:
-            dict: summary с total_fetched, written_history, last_refresh, errors.
-        """
-        logger.info('Starting rates update...')
-        collected_rates = {}
-        collected_meta = {}
-        total_fetched = 0
+    def _persist_late(self, client_name: str, outcome: tuple) -> None:
+        """Ответ, пришедший после deadline: запрос уже оплачен — курсы сохраняются."""
+        rates, meta, error, elapsed = outcome
+        if error is not None or not rates:
+            return
         errors = []
+        self._persist(rates, meta, errors)
+        logger.info(f'{client_name} answered after the deadline ({int(elapsed * 1000)} ms): '
+                    f'{len(rates)} rates saved' + (f', errors: {errors}' if errors else ''))
 
-        for client in self.clients:
-            client_name = client.__class__.__name__
-            if source and source.lower() not in client_name.lower():
-                continue
+    def _persist(self, rates: dict, meta: dict, errors: list) -> tuple[int, int, str]:
+        """
+        Пишет курсы одного клиента в историю, колоночное хранилище и кэш
+        и публикует события об изменившихся курсах (EventBus).
 
-            logger.info(f'Fetching from {client_name}...')
-            try:
-                rates, meta = client.fetch_rates()
-                fetched = len(rates)
-                total_fetched += fetched
-                logger.info(f'OK ({fetched} rates)')
-                collected_rates.update(rates)
-                collected_meta.update(meta)
-            except Exception as e:
-                logger.error(f'Failed: {e}')
-                errors.append((client_name, str(e)))
-
-        # ← КЛЮЧЕВОЕ: если ничего не получено → не падаем, но не пишем
-        if not collected_rates:
-            logger.warning("No rates fetched. Skipping cache write.")
-            return {
-                'total_fetched': 0,
-                'written_history': 0,
-                'last_refresh': None,
-                'errors': errors or ['no_data']
-            }
+        Курсы из ответа 304 (или без запроса — до следующего обновления
+        провайдера) — это уже записанные измерения: они только продлевают
+        updated_at в кэше, а в историю не попадают.
 
+        Возвращает (число пар в кэше, записей истории, last_refresh).
+        """
         last_refresh = self._utc_iso_now()
         updated_pairs = {}
 
-        written_history = 0
-        for key, rate in collected_rates.items():
+        measurements = []
+        for key, rate in rates.items():
             try:
                 from_code, to_code = key.split('_')
-                source_name = collected_meta.get(key, {}).get('source', 'unknown')
+                source_name = meta.get(key, {}).get('source', 'unknown')
                 updated_pairs[key] = {
                     'rate': float(rate),
                     'updated_at': last_refresh,
                     'source': source_name
                 }
-
-                self.history.save_measurement(
-                    from_currency=from_code,
-                    to_currency=to_code,
-                    rate=rate,
-                    source=source_name,
-                    meta=collected_meta.get(key, {})
-                )
-                written_history += 1
+                if meta.get(key, {}).get('status_code') == 304:
+                    continue
+                measurements.append({
+                    'from_currency': from_code,
+                    'to_currency': to_code,
+                    'rate': rate,
+                    'source': source_name,
+                    'meta': meta.get(key, {})
+                })
             except Exception as e:
                 logger.error(f'Failed to process {key}: {e}')
+                errors.append((key, str(e)))
+
+        # Вся история одного ответа пишется одной порцией
+        written_history = 0
+        try:
+            saved, rejected = self.history.save_measurements(measurements) if measurements else ([], [])
+            written_history = len(saved)
+            for key, reason in rejected:
+                logger.error(f'Failed to process {key}: {reason}')
+                errors.append((key, reason))
+        except Exception as e:
+            logger.error(f'History write failed: {e}')
+            errors.append(('history', str(e)))
+            saved = []
 
-        # ← Безопасная запись
         try:
-            self.cache.write(updated_pairs, last_refresh)
-            logger.info(f'Wrote {len(updated_pairs)} rates to cache')
+            self.columns.append_entries(saved)
+        except Exception as e:
+            logger.error(f'Columnar history write failed: {e}')
+            errors.append(('columns', str(e)))
+
+        # ← Кэш сливает пары сам: курсы других источников сохраняются
+        try:
+            changed = self.cache.write(updated_pairs, last_refresh)
+            logger.info(f'Wrote {len(updated_pairs)} rates to cache ({len(changed)} changed)')
         except Exception as e:
             logger.error(f'Cache write failed: {e}')
             errors.append(('cache', str(e)))
+            return 0, written_history, last_refresh
+
+        # Смена источника без сдвига курса — не rate_change
+        self.bus.publish([
+            rate_change(key, old, updated_pairs[key]['rate'], updated_pairs[key]['source'], last_refresh)
+            for key, old in changed.items()
+            if old != updated_pairs[key]['rate']
+        ])
+        return len(updated_pairs), written_history, last_refresh
+
+    def run_update(self, source: str = None, deadline: float = None) -> dict:
+        """
+        Запускает обновление курсов.
+
+        Клиенты опрашиваются параллельно в потоках-демонах; ответ каждого
+        записывается сразу по приходу, не дожидаясь остальных. Клиенты,
+        не ответившие за deadline секунд, попадают в errors, а метод
+        возвращается, не дожидаясь их: поток-демон не держит и выход
+        процесса. Если опоздавший ответ всё же придёт (до REQUEST_TIMEOUT),
+        его курсы записывает сам поток.
+
+        Args:
+            source: 'coingecko' или 'exchangerate' — обновить только один источник.
+            deadline: общий срок на все запросы (по умолчанию UPDATE_DEADLINE).
+
+        Returns:
+            dict: summary с total_fetched, written_history, last_refresh, errors
+            и timings — {клиент: {'ms', 'status', 'fetched'}}.
+        """
+        logger.info('Starting rates update...')
+        deadline = self.config.UPDATE_DEADLINE if deadline is None else deadline
+        clients = [
+            c for c in self.clients
+            if not source or source.lower() in c.__class__.__name__.lower()
+        ]
+
+        total_fetched = 0
+        written_history = 0
+        cached = 0
+        last_refresh = None
+        errors = []
+        timings = {}
+
+        def handle(client_name: str, outcome: tuple) -> None:
+            nonlocal total_fetched, cached, written_history, last_refresh
+            rates, meta, error, elapsed = outcome
+            timings[client_name] = {'ms': int(elapsed * 1000), 'status': 'ok', 'fetched': len(rates)}
+            if error is not None:
+                logger.error(f'{client_name} failed: {error}')
+                errors.append((client_name, str(error)))
+                timings[client_name]['status'] = 'error'
+                return
+            logger.info(f'{client_name} OK ({len(rates)} rates, {timings[client_name]["ms"]} ms)')
+            total_fetched += len(rates)
+            if rates:
+                pairs, history, last_refresh = self._persist(rates, meta, errors)
+                cached += pairs
+                written_history += history
+
+        results: queue.Queue = queue.Queue()
+        lock = threading.Lock()
+        abandoned = set()
+
+        def worker(client: BaseApiClient) -> None:
+            client_name = client.__class__.__name__
+            outcome = self._fetch(client)
+            with lock:
+                late = client_name in abandoned
+                if not late:
+                    results.put((client_name, outcome))
+            if late:
+                self._persist_late(client_name, outcome)
+
+        # Потоки-демоны: зависший запрос не задерживает ни возврат, ни выход процесса
+        pending = set()
+        for client in clients:
+            logger.info(f'Fetching from {client.__class__.__name__}...')
+            pending.add(client.__class__.__name__)
+            threading.Thread(target=worker, args=(client,), name='rates-fetch', daemon=True).start()
+
+        stop_at = perf_counter() + deadline
+        while pending:
+            try:
+                client_name, outcome = results.get(timeout=max(0.0, stop_at - perf_counter()))
+            except queue.Empty:
+                with lock:
+                    abandoned.update(pending)
+                    arrived = []
+                    while not results.empty():
+                        arrived.append(results.get_nowait())
+                for client_name, outcome in arrived:
+                    abandoned.discard(client_name)
+                    pending.discard(client_name)
+                    handle(client_name, outcome)
+                for client_name in sorted(pending):
+                    logger.error(f'{client_name} did not answer within {deadline}s')
+                    errors.append((client_name, f'deadline {deadline}s exceeded'))
+                    timings[client_name] = {'ms': int(deadline * 1000), 'status': 'timeout', 'fetched': 0}
+                break
+            pending.discard(client_name)
+            handle(client_name, outcome)
+
+        # ← КЛЮЧЕВОЕ: если ничего не получено → не падаем, но не пишем
+        if not total_fetched:
+            logger.warning("No rates fetched. Skipping cache write.")
+            self.last_summary = {
+                'total_fetched': 0,
+                'written_history': 0,
+                'last_refresh': None,
+                'errors': errors or ['no_data'],
+                'timings': timings
+            }
+            return self.last_summary
 
         summary = {
             'total_fetched': total_fetched,
             'written_history': written_history,
             'last_refresh': last_refresh,
-            'errors': errors
+            'errors': errors,
+            'timings': timings
         }
 
-        logger.info(f'Update complete. Fetched: {total_fetched}, Cache: {len(updated_pairs)}')
-        return summary
\ No newline at end of file
+        logger.info(f'Update complete. Fetched: {total_fetched}, Cache: {cached}')
+        self.last_summary = summary
+        return summary
+
+
+REFRESHED = 'refreshed'   # обновление выполнил этот процесс
+COALESCED = 'coalesced'   # обновление выполнил другой процесс, дождались его
+BUSY = 'busy'             # другой процесс ещё обновляет, ждать дольше нельзя
+
+
+def source_for_pair(from_code: str, to_code: str, config: ParserConfig = cfg) -> Optional[str]:
+    """
+    Какой источник обновлять ради пары: 'coingecko' для криптовалют,
+    'exchangerate' для фиата, None — нужны оба (кросс-курс крипта↔фиат)
+    или включён офлайн-режим REPLAY_MODE.
+    """
+    if config.REPLAY_MODE:
+        return None
+    codes = {from_code.upper(), to_code.upper()} - {config.BASE_CURRENCY}
+    if codes and codes <= set(config.CRYPTO_CURRENCIES):
+        return 'coingecko'
+    if codes and codes <= set(config.FIAT_CURRENCIES):
+        return 'exchangerate'
+    return None
+
+
+def refresh_single_flight(
+    is_fresh: Optional[Callable[[], bool]] = None,
+    wait: Optional[float] = None,
+    updater: Optional['RatesUpdater'] = None,
+    config: ParserConfig = cfg,
+    source: Optional[str] = None
+) -> str:
+    """
+    Обновление курсов «в один полёт» для всех процессов.
+
+    Первый процесс берёт аренду источника LOCKS_DIR/rates-refresh-<source>.lock
+    (rates-refresh-all.lock — все источники) и обращается к API; остальные
+    не делают своих запросов, а ждут окончания до wait секунд (wait=0 —
+    не ждать) и перечитывают снимок. is_fresh проверяется под арендой:
+    если кто-то только что обновил курсы, повторного запроса не будет, а
+    если после ожидания пара всё ещё устарела (обновление не удалось),
+    дождавшийся процесс обновляет её сам. Так число обращений к API за окно
+    TTL не зависит от числа клиентов. source — обновить только один
+    источник (см. source_for_pair), пары остальных в кэше не трогаются.
+
+    Возвращает REFRESHED, COALESCED или BUSY (отдавать устаревшие данные).
+    """
+    wait = config.REFRESH_WAIT if wait is None else wait
+    lock_path = locking.named_lock_path(f'rates-refresh-{source or "all"}')
+    with locking.try_file_lock(lock_path) as acquired:
+        if acquired:
+            if is_fresh and is_fresh():
+                return COALESCED
+            (updater or RatesUpdater(config=config)).run_update(source)
+            return REFRESHED
+
+    logger.info(f'Rates refresh ({source or "all"}) already in progress in another process, waiting...')
+    with locking.try_file_lock(lock_path, timeout=wait) as acquired:
+        if not acquired:
+            return BUSY
+        if is_fresh and not is_fresh():
+            (updater or RatesUpdater(config=config)).run_update(source)
+            return REFRESHED
+        return COALESCED
+